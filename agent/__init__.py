@@ -1,6 +1,7 @@
 __all__ = [
-    "social_assessor_assistant","get_logger"
+    "social_assessor_assistant","get_logger","analyze_posts"
 ]
 
 from .log_config import get_logger
-from .main import social_assessor_assistant
\ No newline at end of file
+from .main import social_assessor_assistant
+from .batch import analyze_posts
\ No newline at end of file
@@ -0,0 +1,135 @@
+import html
+import os
+import re
+import signal
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = ["analyze_posts", "post_fingerprint"]
+
+from agent.main import social_assessor_assistant, ANALYSIS_MODE
+from agent.nodes import SupervisorNode
+from agent.tools.triage import triage_post, DEFAULT_RESULT, SKIP_CONTEXT, EVALUATE_CONTEXT
+from agent.utils.cache import DiskCache, cache_key
+from agent.utils.trace import post_trace
+
+# 内容相同的帖子（转推、跨平台重复发布的视频）直接复用分析结果
+post_results = DiskCache("post_results", ttl=int(os.getenv("POST_RESULT_TTL", 90 * 24 * 3600)),
+                         max_entries=int(os.getenv("POST_RESULT_MAX_ENTRIES", 100000)))
+
+TRANSCRIPT_LABEL = "帖子视听文本数据："
+
+
+def _normalize(text):
+    text = html.unescape(re.sub(r'https?://\S+', '', text))
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+def post_fingerprint(input_content):
+    """计算帖子内容的指纹：去除链接、反转义 HTML 后的文本 + 视听文本的哈希"""
+    text, _, transcript = input_content.partition(TRANSCRIPT_LABEL)
+    return cache_key(_normalize(text), cache_key(_normalize(transcript)))
+
+
+def _analyze(task, fingerprint, logger, mode):
+    with post_trace(task.get("key") or fingerprint[:16]):
+        return _analyze_post(task, fingerprint, logger, mode)
+
+
+def _analyze_post(task, fingerprint, logger, mode):
+    route, reason = triage_post(task["input_content"])
+    if route == "skip":
+        logger.info(f"用户 [{task['user_name']}] 的帖子信息量过少，跳过分析（{reason}）")
+        return dict(DEFAULT_RESULT), SKIP_CONTEXT
+    # 快速模式的结果单独保存，不用于完整模式
+    if mode != "full":
+        fingerprint = cache_key(mode, fingerprint)
+    cached = post_results.get(fingerprint)
+    if cached is not None:
+        logger.info(f"用户 [{task['user_name']}] 的帖子与已分析的帖子内容相同，复用分析结果")
+        return cached[0], cached[1]
+    logger.info(f"正在分析用户 [{task['user_name']}] 的帖子，时间：{task['create_time']}，分析方式：{route}（{reason}）")
+    # 只评估的帖子传入固定的背景说明，social_assessor_assistant 将跳过背景调查
+    context = EVALUATE_CONTEXT if route == "evaluate" else ""
+    result, context = social_assessor_assistant(task["user_name"], task["create_time"], task["input_content"], logger,
+                                                context, mode)
+    # 只保存字段完整的评估结果
+    if SupervisorNode.is_complete(result):
+        post_results.set(fingerprint, [result, context])
+    return result, context
+
+
+def _install_sigint_handler(stop, logger):
+    """第一次 Ctrl+C 只停止提交新任务，第二次恢复默认行为抛出 KeyboardInterrupt；仅主线程可注册"""
+    if threading.current_thread() is not threading.main_thread():
+        return None
+
+    def handler(signum, frame):
+        logger.warning("收到中断信号，停止提交新任务，等待进行中的任务完成后退出（再次按 Ctrl+C 放弃进行中的任务）")
+        stop.set()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    return signal.signal(signal.SIGINT, handler)
+
+
+def analyze_posts(tasks, logger, max_workers=None, mode=None):
+    """并发分析多条帖子，并按输入顺序逐条返回结果
+
+    每条帖子的分析大部分时间在等待 LLM、搜索与网页抓取，使用线程池并发执行；
+    各后端的并发上限由 agent.utils.concurrency.backend_limit 控制。
+    收到 SIGINT 时不再提交新任务，尚未开始的任务被取消，已开始的任务完成后照常返回，
+    调用方可以继续写入这些结果并记录进度。
+    内容相同的帖子只分析一次：已有结果的直接复用，本次运行中重复的帖子共用同一个任务。
+
+    参数:
+        tasks (Iterable[dict]): 待分析的帖子，需包含 user_name、create_time、input_content
+        logger: 日志记录器
+        max_workers (int): 线程数，默认读取环境变量 ANALYSIS_WORKERS（默认为4）
+        mode (str): 分析模式 full 或 fast，默认读取环境变量 ANALYSIS_MODE
+
+    返回:
+        Iterator[tuple]: (task, (post_evaluate, context))，顺序与输入一致
+    """
+    max_workers = max_workers or int(os.getenv("ANALYSIS_WORKERS", 4))
+    mode = mode or ANALYSIS_MODE
+    stop = threading.Event()
+    previous_handler = _install_sigint_handler(stop, logger)
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis")
+    abandoned = False
+    try:
+        pending = deque()
+        submitted = {}
+        for task in tasks:
+            if stop.is_set():
+                break
+            fingerprint = post_fingerprint(task["input_content"])
+            future = submitted.get(fingerprint)
+            if future is None:
+                future = submitted[fingerprint] = executor.submit(_analyze, task, fingerprint, logger, mode)
+            else:
+                logger.info(f"用户 [{task['user_name']}] 的帖子与本次运行中的其他帖子内容相同，共用分析结果")
+            pending.append((task, future))
+            # 限制在途任务数量，按顺序输出已完成的结果
+            while len(pending) >= max_workers * 2 and not stop.is_set():
+                done_task, future = pending.popleft()
+                yield done_task, future.result()
+        if stop.is_set():
+            # 内容相同的帖子共用同一个任务，按任务去重后计数
+            futures = {id(future): future for _, future in pending}.values()
+            cancelled = sum(future.cancel() for future in futures)
+            logger.warning(f"已取消 {cancelled} 个尚未开始的任务")
+        while pending:
+            done_task, future = pending.popleft()
+            if not future.cancelled():
+                yield done_task, future.result()
+    except (KeyboardInterrupt, GeneratorExit):
+        # 再次 Ctrl+C 或调用方提前结束迭代：取消未开始的任务，不再等待进行中的任务
+        abandoned = True
+        raise
+    finally:
+        if abandoned:
+            logger.warning("已放弃进行中的任务，其结果不会写入；已发出的请求返回后进程退出")
+        executor.shutdown(wait=not abandoned, cancel_futures=abandoned)
+        if previous_handler is not None:
+            signal.signal(signal.SIGINT, previous_handler)
@@ -1,4 +1,4 @@
 __all__ = [
-    "context_research_flow","social_assessor_flow"
+    "context_research_flow","social_assessor_flow","fast_assessor_flow"
 ]
-from .social_assessor_flow import social_assessor_flow, context_research_flow
+from .social_assessor_flow import social_assessor_flow, context_research_flow, fast_assessor_flow
@@ -1,8 +1,8 @@
 from pocketflow import Flow, Node
 
-from agent.nodes import DecideAction, SearchWeb, PostEvaluate, SupervisorNode
+from agent.nodes import DecideAction, SearchWeb, PostEvaluate, SupervisorNode, FastEvaluate
 
-__all__ = ["context_research_flow", "social_assessor_flow"]
+__all__ = ["context_research_flow", "social_assessor_flow", "fast_assessor_flow"]
 
 
 class NoOp(Node):
@@ -52,3 +52,25 @@ def social_assessor_flow():
 
     # 创建并返回外部流程，从 agent_flow 开始
     return Flow(start=post_evaluate)
+
+
+def fast_assessor_flow():
+    """
+    创建快速模式的流程：由 FastEvaluate 一次调用完成评估，必要时先搜索一轮。
+
+    返回:
+        Flow: 快速评估流程
+    """
+    fast_evaluate = FastEvaluate()
+    search_web = SearchWeb()
+    end = NoOp()
+
+    fast_evaluate - "search" >> search_web
+
+    search_web - "decide" >> fast_evaluate
+
+    fast_evaluate - "evaluate" >> end
+
+    fast_evaluate - "finish" >> end
+
+    return Flow(start=fast_evaluate)
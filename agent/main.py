@@ -8,7 +8,12 @@ __all__ = ["social_assessor_assistant"]
 from typing import Any
 
 from agent import get_logger
-from agent.flow import context_research_flow, social_assessor_flow
+from agent.flow import context_research_flow, social_assessor_flow, fast_assessor_flow
+from agent.nodes.contextual_research import render_context
+from agent.utils.context_store import context_store, CONTEXT_REUSE_THRESHOLD, CONTEXT_EXTEND_THRESHOLD
+
+# 分析模式：full 为多轮背景调查 + 评估；fast 为单次调用评估，最多搜索 FAST_SEARCH_ROUNDS 轮
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "full")
 
 def extract_time_from_filename(filename: str) -> str:
     """从文件名中提取时间部分，格式如：2024-11-12 02-25-img_74.jpg"""
@@ -20,18 +25,14 @@ def extract_time_from_filename(filename: str) -> str:
     return "unknown_time"
 
 
-def social_assessor_assistant(user_name, create_time, input_content, logger, context=""):
+def social_assessor_assistant(user_name, create_time, input_content, logger, context="", mode=None):
+    mode = mode or ANALYSIS_MODE
+    if mode == "fast":
+        return fast_assessor_assistant(user_name, create_time, input_content, logger, context)
     try:
 
         if context == "":
-            # 背景调查信息
-            research_shared = {
-                "user_name": user_name, "create_time": create_time, "post": input_content, "logger": logger
-            }
-            context_agent_flow = context_research_flow()
-            context_agent_flow.run(research_shared)
-
-            context = research_shared.get("context", "内容未分析完成")
+            context = research_context(user_name, create_time, input_content, logger)
 
         logger.info(f"\n ---开始结合背景调查信息进行内容分析--- \n 背景：\n {context}")
 
@@ -50,6 +51,68 @@ def social_assessor_assistant(user_name, create_time, input_content, logger, con
         return "内容分析出现异常。", context
 
 
+def fast_assessor_assistant(user_name, create_time, input_content, logger, context=""):
+    """快速模式：一次调用完成评估，必要时先搜索一轮
+
+    传入 context 或命中相似帖子的背景调查结果时不再搜索
+    """
+    try:
+        shared = {
+            "user_name": user_name, "create_time": create_time, "post": input_content, "logger": logger
+        }
+        if context == "":
+            score, entry = context_store.lookup(user_name, create_time, input_content)
+            if entry is not None and score >= CONTEXT_REUSE_THRESHOLD:
+                logger.info(f"复用相似帖子的背景调查结果，相似度 {score:.2f}")
+                context = entry["context"]
+        if context != "":
+            shared.update({"context": context, "max_search_rounds": 0})
+        fast_assessor_flow().run(shared)
+
+        context = shared.get("context", "")
+        post_evaluate = shared.get("post_evaluate", "内容未分析完成")
+        logger.info(f"[Agent任务完成]-[DONE]: \n {post_evaluate} ")
+        return post_evaluate, context
+    except Exception as e:
+        logger.error(f"内容分析出现异常: {e}")
+        return "内容分析出现异常。", context
+
+
+def research_context(user_name, create_time, input_content, logger):
+    """对帖子进行背景调查
+
+    同一用户同一周内高度相似的帖子直接复用已有的背景调查结果；
+    部分相似的帖子以已有的搜索结果为起点，由决策节点判断是否需要补充搜索
+    """
+    score, entry = context_store.lookup(user_name, create_time, input_content)
+    if entry is not None and score >= CONTEXT_REUSE_THRESHOLD:
+        logger.info(f"复用相似帖子的背景调查结果，相似度 {score:.2f}")
+        return entry["context"]
+
+    # 背景调查信息
+    research_shared = {
+        "user_name": user_name, "create_time": create_time, "post": input_content, "logger": logger
+    }
+    if entry is not None and score >= CONTEXT_EXTEND_THRESHOLD and entry["context_rounds"]:
+        logger.info(f"以相似帖子的搜索结果为起点进行背景调查，相似度 {score:.2f}")
+        research_shared.update({
+            "context_rounds": list(entry["context_rounds"]),
+            "seen_links": set(entry["seen_links"]),
+            "links_count": entry["links_count"],
+            "context": render_context(entry["context_rounds"]),
+        })
+    context_agent_flow = context_research_flow()
+    context_agent_flow.run(research_shared)
+
+    context = research_shared.get("context", "内容未分析完成")
+    # 只保存决策节点给出最终回答的调查结果
+    if "search_history" in research_shared:
+        context_store.add(user_name, create_time, input_content, context,
+                          research_shared.get("context_rounds"), research_shared.get("seen_links"),
+                          research_shared.get("links_count", 0))
+    return context
+
+
 def build_input_content(text_content: str, video_content: str = None) -> str:
     content_parts = ["帖子文本内容：", text_content]
 
@@ -1,9 +1,10 @@
 __all__ = [
     "PostEvaluate",
     "SupervisorNode",
+    "FastEvaluate",
     "DecideAction",
     "SearchWeb"
 ]
 
 from agent.nodes.contextual_research import DecideAction, SearchWeb
-from agent.nodes.post_evaluate import PostEvaluate, SupervisorNode
+from agent.nodes.post_evaluate import PostEvaluate, SupervisorNode, FastEvaluate
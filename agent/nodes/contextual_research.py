@@ -1,19 +1,68 @@
-from asyncio import sleep
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urldefrag
 
 from dotenv import load_dotenv
 from pocketflow import Node
 
 from agent.tools.crawler import WebCrawler
 from agent.tools.parser import analyze_site
-import yaml
 
 from agent.tools.search import search_web
-from agent.utils.call_llm import call_llm
+from agent.utils.concurrency import domain_limit
+from agent.utils.structured import JSON_MODE, structured_call
+from agent.utils.trace import traced_node, bind
 
 load_dotenv()
 __all__ = ["DecideAction", "SearchWeb", ]
 
+# 单次搜索中抓取与总结全部链接的总时限（秒），超时未完成的链接将被忽略
+CRAWL_DEADLINE = float(os.getenv("SEARCH_CRAWL_DEADLINE", 60))
 
+# 背景调查上下文的字符上限；最近 CONTEXT_FULL_ROUNDS 轮搜索保留完整结果，更早的轮次只保留标题与汇总
+CONTEXT_MAX_CHARS = int(os.getenv("CONTEXT_MAX_CHARS", 8000))
+CONTEXT_FULL_ROUNDS = int(os.getenv("CONTEXT_FULL_ROUNDS", 1))
+COMPRESSED_SUMMARY_CHARS = 200
+
+# 每轮搜索最多并发执行的查询数
+SEARCH_MAX_QUERIES = int(os.getenv("SEARCH_MAX_QUERIES", 3))
+
+if JSON_MODE:
+    DECISION_FORMAT = """请只返回一个 JSON 对象：
+
+            ```json
+            {"thinking": "<你的逐步推理过程>", "action": "search 或 answer", "reason": "<为什么选择这个操作>", "answer": "<如果操作是回答>", "search_queries": ["<具体的搜索查询如果操作是搜索>", "<针对其他查询条件的搜索查询(可选)>"]}
+            ```
+            重要：请确保：
+
+            1. 多行文本使用 \\n 表示换行
+            2. 返回字段的值使用中文
+            """
+else:
+    DECISION_FORMAT = """请以以下格式返回你的响应：
+
+            ```yaml
+            thinking: |
+                <你的逐步推理过程>
+            action: search OR answer
+            reason: <为什么选择这个操作>
+            answer: <如果操作是回答>
+            search_queries:
+                - <具体的搜索查询如果操作是搜索>
+                - <针对其他查询条件的搜索查询(可选)>
+            ```
+            重要：请确保：
+
+            1. 使用|字符表示多行文本字段
+            2. 多行字段使用缩进（4个空格）
+            3. 单行字段不使用|字符
+            4. 不允许直接在键后嵌套另一个键（如 answer: search_queries:)
+            5. 非键值对不允许随意使用冒号: 
+            6. 返回字段的值使用中文
+            """
+
+
+@traced_node
 class DecideAction(Node):
     def prep(self, shared):
         """准备上下文和问题，用于决策过程。
@@ -73,9 +122,9 @@ class DecideAction(Node):
 
             ## 操作空间
             [1] search
-              描述: 在网络上查找更多信息
+              描述: 在网络上查找更多信息，可同时给出多条针对不同查询条件的搜索内容，将并发执行
               参数:
-                - query (str): 搜索内容
+                - search_queries (list): 搜索内容，最多{SEARCH_MAX_QUERIES}条
 
             [2] answer
               描述: 用当前知识回答问题
@@ -88,42 +137,19 @@ class DecideAction(Node):
             重要：请确保：
             如先前的研究，总计大于5条，则结合已有的研究进行回答操作，不再进行深度搜索，
             
-            请以以下格式返回你的响应：
-
-            ```yaml
-            thinking: |
-                <你的逐步推理过程>
-            action: search OR answer
-            reason: <为什么选择这个操作>
-            answer: <如果操作是回答>
-            search_query: <具体的搜索查询如果操作是搜索>
-            ```
-            重要：请确保：
-
-            1. 使用|字符表示多行文本字段
-            2. 多行字段使用缩进（4个空格）
-            3. 单行字段不使用|字符
-            4. 不允许直接在键后嵌套另一个键（如 answer: search_query:)
-            5. 非键值对不允许随意使用冒号: 
-            6. 返回字段的值使用中文
-            """
-        # 调用 LLM 进行决策
-        response, success = call_llm(prompt, logger)
-        if not success:
-            logger.error("LLM 响应失败，请检查你的响应格式。")
-            return {"action": "finish", "reason": "LLM 响应失败"}
-
-        # 解析响应以获取决策
-        if "```yaml" not in response:
-            logger.error("LLM 响应格式不正确，请检查你的响应格式。")
-            return {"action": "finish", "reason": "LLM 响应格式不正确"}
-        try:
-            yaml_str = response.replace("\"", "").replace("\'", "").split("```yaml")[1].split("```")[0].strip()
-            logger.info(f"LLM 响应: {yaml_str}")
-            decision = yaml.safe_load(yaml_str)
-        except Exception as e:
+            {DECISION_FORMAT}"""
+        # 调用 LLM 进行决策，无法解析时在重试次数内重新请求
+        decision = structured_call(prompt, "decide_action", logger,
+                                   repair=lambda text: text.replace("\"", "").replace("\'", ""))
+        if decision is None:
             return {"action": "finish", "reason": "LLM 响应格式不正确"}
+        logger.info(f"LLM 响应: {decision}")
 
+        if decision.get("action") == "search":
+            decision["search_queries"] = parse_search_queries(decision)
+            if not decision["search_queries"]:
+                logger.error("LLM 选择了搜索但未给出搜索查询。")
+                return {"action": "finish", "reason": "缺少搜索查询"}
         return decision
 
     def post(self, shared, prep_res, exec_res):
@@ -131,82 +157,205 @@ class DecideAction(Node):
         # 如果 LLM 决定搜索，则保存搜索查询
         logger = shared["logger"]
         if exec_res["action"] == "search":
-            shared["search_query"] = exec_res["search_query"]
-            logger.info(f"🔍 代理决定搜索: {exec_res['search_query']}")
-        else:
-            shared["search_history"] = shared["context"]  # 保存上下文，如果 LLM 在不搜索的情况下给出回答。
-            shared["context"] = exec_res["answer"]
+            shared["search_queries"] = exec_res["search_queries"]
+            shared["search_query"] = "；".join(exec_res["search_queries"])
+            logger.info(f"🔍 代理决定搜索: {exec_res['search_queries']}")
+        elif exec_res["action"] == "answer":
+            shared["search_history"] = shared.get("context", "")  # 保存上下文，如果 LLM 在不搜索的情况下给出回答。
+            shared["context"] = exec_res.get("answer") or shared["search_history"]
             logger.info(f"💡 代理决定回答问题")
+        else:
+            logger.warning(f"背景调查结束: {exec_res.get('reason', '未知原因')}")
 
         # 返回操作以确定流程中的下一个节点
         return exec_res["action"]
 
 
-total_links_count = 0
-
-
+@traced_node
 class SearchWeb(Node):
     def prep(self, shared):
         """从共享存储中获取搜索查询。"""
-        return shared["search_query"],  shared["logger"]
+        search_queries = shared.get("search_queries") or [shared["search_query"]]
+        return search_queries, shared.get("links_count", 0), set(shared.get("seen_links", ())), shared["logger"]
 
     def exec(self, inputs):
-        """搜索网络上的给定查询。"""
+        """并发搜索网络上的给定查询，合并结果后统一抓取与总结。
+
+        返回:
+            tuple: (本轮搜索记录, 本轮新抓取的链接, 累计链接数)
+        """
         # 调用搜索实用函数
-        global total_links_count  # 声明使用全局变量
-        search_query,  logger = inputs
-        logger.info(f"🌐 在网络上搜索: {search_query}")
-        _, results_dict = search_web(search_query,  logger)
-        analyzed_results = []
-        if results_dict is None:
+        # 链接数按帖子统计，多个帖子并发分析时互不影响
+        search_queries, total_links_count, seen_links, logger = inputs
+        search_query = "；".join(search_queries)
+        logger.info(f"🌐 在网络上搜索: {search_queries}")
+        with ThreadPoolExecutor(max_workers=len(search_queries), thread_name_prefix="search") as executor:
+            futures = [executor.submit(bind(search_web), query, logger) for query in search_queries]
+            responses = [future.result()[1] for future in futures]
+        if all(response is None for response in responses):
             logger.info(f"🌐 深度搜索失败。")
-            return {"action": "finish", "reason": "搜索失败"}
-        for i in results_dict:
-            title = i['title']
-            snippet = i['snippet']
-            link = i['link']
+            return {"query": search_query, "results": [], "note": "搜索失败，未获取到结果。"}, [], total_links_count
+        # 按查询顺序合并各查询的结果
+        results_dict = [i for response in responses if response for i in response]
 
+        # 跳过先前轮次已抓取过的链接
+        links = []
+        for i in results_dict:
+            link = _normalize_link(i['link'])
+            if link in seen_links or link in links:
+                logger.info(f"🌐 已在先前的研究中出现，跳过: {i['link']}")
+                continue
             logger.info(f"🌐 对搜索的内容进项深度扫描")
-            logger.info(f"🌐 标题:{title}")
-            logger.info(f"🌐 摘要:{snippet}")
-            # 统计链接数量
-            total_links_count += 1
-            logger.info(f"🌐 源链接:{link}")
-            content_list = WebCrawler(link).crawl()
+            logger.info(f"🌐 标题:{i['title']}")
+            logger.info(f"🌐 摘要:{i['snippet']}")
+            logger.info(f"🌐 源链接:{i['link']}")
+            links.append(link)
+        if not links:
+            return {"query": search_query, "results": [], "note": "搜索结果均已在先前的研究中出现。"}, [], total_links_count
+        # 统计链接数量
+        total_links_count += len(links)
 
-            analyzed_results.append(analyze_site(content_list, logger))
+        analyzed_results = crawl_and_analyze(links, logger)
 
         results = []
+        urls = set()
         for analyzed_result in analyzed_results:
             for content in analyzed_result:
-
-                result = (f"标题：{content.get('title', '无')}\n" +
-                          f"链接：{content.get('url', '无')}\n" +
-                          f"汇总：{content['analysis']['summary']}\n" +
-                          f"话题：{content['analysis']['topics']}\n" +
-                          f"类型：{content['analysis']['content_type']}\n"
-                          )
-                results.append(result)
+                url = _normalize_link(content.get('url', ''))
+                if url in urls:
+                    continue
+                urls.add(url)
+                results.append({
+                    "title": content.get('title', '无'),
+                    "url": content.get('url', '无'),
+                    "summary": content['analysis']['summary'],
+                    "topics": content['analysis']['topics'],
+                    "content_type": content['analysis']['content_type'],
+                })
 
         logger.info(f"✅ 当前已采集链接总数: {total_links_count}")
 
-        return '\n\n'.join(results), total_links_count
+        return {"query": search_query, "results": results}, links, total_links_count
 
     def post(self, shared, prep_res, exec_res):
         """保存搜索结果并返回决策节点。"""
-        # 将搜索结果添加到共享存储中的上下文中
-        results, links_count = exec_res
-        previous = shared.get("context", "")
-        # 搜索记忆功能
-        shared["context"] = previous + "\n\n搜索条件: " + shared["search_query"] + "\n搜索结果(多条):\n " + results
+        # 按轮次保存搜索结果，再在字符上限内重新生成上下文
+        search_round, links, links_count = exec_res
+        shared.setdefault("context_rounds", []).append(search_round)
+        shared.setdefault("seen_links", set()).update(links)
+        shared["context"] = render_context(shared["context_rounds"])
         logger = shared["logger"]
         shared["links_count"] = links_count
-        logger.info(f"📚 找到信息，分析结果...")
+        logger.info(f"📚 找到信息，分析结果... 上下文长度: {len(shared['context'])}")
 
         # 搜索后始终返回决策节点
         return "decide"
 
 
+def parse_search_queries(decision):
+    """从决策中取出搜索查询列表，兼容单条的 search_query 字段
+
+    返回:
+        List[str]: 去重后的查询，最多 SEARCH_MAX_QUERIES 条
+    """
+    queries = decision.get("search_queries") or []
+    if isinstance(queries, str):
+        queries = [queries]
+    if decision.get("search_query"):
+        queries = list(queries) + [decision["search_query"]]
+    result = []
+    for query in queries:
+        query = str(query).strip() if query is not None else ""
+        if query and query not in result:
+            result.append(query)
+    return result[:SEARCH_MAX_QUERIES]
+
+
+def _normalize_link(url):
+    return urldefrag(url)[0].rstrip("/")
+
+
+def _render_full(search_round):
+    results = [(f"标题：{content['title']}\n" +
+                f"链接：{content['url']}\n" +
+                f"汇总：{content['summary']}\n" +
+                f"话题：{content['topics']}\n" +
+                f"类型：{content['content_type']}\n"
+                ) for content in search_round["results"]]
+    body = '\n\n'.join(results) if results else search_round.get("note", "无结果。")
+    return "搜索条件: " + search_round["query"] + "\n搜索结果(多条):\n " + body
+
+
+def _render_compressed(search_round):
+    lines = [f"- {content['title']}：{content['summary'][:COMPRESSED_SUMMARY_CHARS]}" for content in search_round["results"]]
+    body = '\n'.join(lines) if lines else search_round.get("note", "无结果。")
+    return "搜索条件: " + search_round["query"] + "\n结果摘要:\n" + body
+
+
+def render_context(rounds, max_chars=CONTEXT_MAX_CHARS, full_rounds=CONTEXT_FULL_ROUNDS):
+    """将多轮搜索结果拼接为提供给决策节点的上下文
+
+    最近 full_rounds 轮保留完整结果，更早的轮次压缩为标题与汇总；
+    超出 max_chars 时从最早的轮次开始丢弃，仍超出时截断
+
+    参数:
+        rounds (List[Dict]): SearchWeb 生成的搜索记录，按时间顺序排列
+        max_chars (int): 上下文字符上限
+        full_rounds (int): 保留完整结果的轮数
+
+    返回:
+        str: 上下文文本
+    """
+    split = max(0, len(rounds) - full_rounds)
+    blocks = [_render_compressed(r) for r in rounds[:split]] + [_render_full(r) for r in rounds[split:]]
+    dropped = 0
+    while len(blocks) > 1 and len('\n\n'.join(blocks)) > max_chars:
+        blocks.pop(0)
+        dropped += 1
+    if dropped:
+        blocks.insert(0, f"(已省略更早的 {dropped} 轮搜索结果)")
+    context = '\n\n'.join(blocks)
+    if len(context) > max_chars:
+        context = context[:max_chars] + "\n...(内容过长已截断)"
+    return context
+
+
+def _crawl_and_analyze_link(link, logger):
+    with domain_limit(link):
+        content_list = WebCrawler(link).crawl()
+    return analyze_site(content_list, logger)
+
+
+def crawl_and_analyze(links, logger, deadline=CRAWL_DEADLINE):
+    """并发抓取并总结多个链接，在总时限内收集已完成的结果
+
+    参数:
+        links (List[str]): 搜索结果链接
+        logger: 日志记录器
+        deadline (float): 总时限（秒）
+
+    返回:
+        List[List[Dict]]: 按链接顺序排列的 analyze_site 结果，超时或失败的链接不包含在内
+    """
+    if not links:
+        return []
+    executor = ThreadPoolExecutor(max_workers=len(links), thread_name_prefix="crawl")
+    futures = [executor.submit(bind(_crawl_and_analyze_link), link, logger) for link in links]
+    done, not_done = wait(futures, timeout=deadline)
+    # 不等待超时的任务，直接返回已完成的结果
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    analyzed_results = []
+    for link, future in zip(links, futures):
+        if future in not_done:
+            logger.warning(f"🌐 抓取超时，已跳过: {link}")
+        elif future.exception() is not None:
+            logger.error(f"🌐 抓取或分析失败: {link}, {future.exception()}")
+        else:
+            analyzed_results.append(future.result())
+    return analyzed_results
+
+
 
 if __name__ == "__main__":
     pass
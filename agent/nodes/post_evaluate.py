@@ -1,17 +1,62 @@
 import os
 import re
+import threading
+from concurrent.futures import Future
 
 from dotenv import load_dotenv
 from pocketflow import Node
-import yaml
-
-from agent.utils.call_llm import call_llm
+from agent.utils.structured import JSON_MODE, structured_call
+from agent.utils.trace import traced_node
 
 load_dotenv()
 
-__all__ = ["PostEvaluate","SupervisorNode"]
+__all__ = ["PostEvaluate","SupervisorNode","FastEvaluate"]
+
+# 快速模式下最多进行的搜索轮数，为0时不进行背景调查
+FAST_SEARCH_ROUNDS = int(os.getenv("FAST_SEARCH_ROUNDS", 1))
+# 快速模式评估结果缺少字段时重新评估的次数
+FAST_EVALUATE_RETRIES = int(os.getenv("FAST_EVALUATE_RETRIES", 1))
+
+EVALUATION_FIELDS = ["topics", "sentiment", "style", "related_events"]
+
+# 批量评估：EVAL_BATCH_SIZE 大于1时，将同时等待评估的帖子合并为一次请求；
+# 首条帖子等待 EVAL_BATCH_WAIT 秒以凑齐一批
+EVAL_BATCH_SIZE = int(os.getenv("EVAL_BATCH_SIZE", 1))
+EVAL_BATCH_WAIT = float(os.getenv("EVAL_BATCH_WAIT", 2))
+
+# 监督节点拒绝评估结果后最多重新评估的次数
+SUPERVISOR_MAX_RETRIES = int(os.getenv("SUPERVISOR_MAX_RETRIES", 2))
+
+if JSON_MODE:
+    EVALUATION_FORMAT = """## 返回格式
+
+只返回一个 JSON 对象：
+
+```json
+{"topics": ["关键词1", "关键词2"], "sentiment": "<整体情绪倾向>", "style": "<语言风格>", "related_events": ["关联事件1", "关联事件2"]}
+```
+"""
+else:
+    EVALUATION_FORMAT = """## 返回格式
+
+```yaml
+topics: ["关键词1" ,"关键词2"]
+sentiment: <整体情绪倾向> 
+style: <语言风格>
+related_events: ["关联事件1","关联事件2"]
+```
+
+重要！请确保：
+- 使用英文双引号包裹字符串；
+- 每个字段独占一行；
+- 每行冒号后保留一个空格；
+- 列表使用方括号 `[ ]` 包裹；
+- 不要使用中文符号（如 `。`、`、`、`“”`）；
+- 如果有换行文本字段，请用 `|` 表示多行字符串，并保持 4 空格缩进；
+"""
 
 
+@traced_node
 class PostEvaluate(Node):
     def prep(self, shared):
         """
@@ -24,7 +69,24 @@ class PostEvaluate(Node):
     def exec(self, inputs):
 
         post, context, logger = inputs
-        prompt = f"""
+        if EVAL_BATCH_SIZE > 1:
+            decision = evaluation_batcher.evaluate(post, context, logger)
+            if decision is not None:
+                return decision
+        return evaluate_post(post, context, logger)
+
+    def post(self, shared, prep_res, exec_res):
+        """
+        将最终文章存储在共享数据中
+        """
+        shared["post_evaluate"] = exec_res
+        logger = shared["logger"]
+        logger.info(f"===内容评估完成===")
+        return "evaluate"
+
+
+def evaluation_prompt(post, context):
+    return f"""
 你是一个专业的内容分析师，结合内容背景并参考分析维度，社交媒体的帖子内容进行分析
 ## 上下文
 
@@ -52,75 +114,167 @@ style：分析帖子的语言风格，常见类型：
 
 related_events：识别帖子关联的现实事件或热点话题，无则返回无热点事件。
 
+{EVALUATION_FORMAT}"""
+
+
+def repair_evaluation(yaml_str):
+    """修复模型常见的 YAML 格式问题：去掉引号与中文符号后按字段重新分行"""
+    yaml_str = yaml_str.replace("\"", "").replace("\'", "").replace("\n", "").strip()
+    yaml_str = yaml_str.replace("。", ".").replace("，", ",").replace("：", ":").replace("“", '"').replace("”",'"')
+    # 插入换行符，强制每行一个字段
+    return re.sub(r'(search_queries:|topics:|sentiment:|style:|related_events:)', r'\n\1', yaml_str)
+
+
+def evaluate_post(post, context, logger):
+    """单独评估一条帖子"""
+    decision = structured_call(evaluation_prompt(post, context), "post_evaluate", logger, repair=repair_evaluation)
+    if decision is None:
+        return {"action": "finish", "reason": "LLM 响应格式不正确"}
+    logger.info(f"LLM 响应: {decision}")
+    return decision
+
+
+def batch_evaluation_prompt(items):
+    posts = "\n\n".join(f"### 帖子 {post_id}\n\n{context}\n\n{post}" for post_id, post, context in items)
+    return f"""
+你是一个专业的内容分析师，下面有 {len(items)} 条社交媒体帖子，请结合各自的内容背景并参考分析维度，分别对每条帖子进行分析
+## 帖子
+
+{posts}
+
+## 分析维度
+topics：提取帖子中最能概括核心内容的关键词或话题标签，要求覆盖核心语义，数量不限
+
+sentiment：判断帖子的整体情感倾向，取值包括 positive、negative、neutral、mixed
+
+style：分析帖子的语言风格，常见类型：formal、informal、humorous、sarcastic、aggressive、inspirational
+
+related_events：识别帖子关联的现实事件或热点话题，无则返回无热点事件。
+
 ## 返回格式
+以一个 JSON 对象返回，键为帖子编号，每条帖子对应一个分析结果：
 
-```yaml
-topics: ["关键词1" ,"关键词2"]
-sentiment: <整体情绪倾向> 
-style: <语言风格>
-related_events: ["关联事件1","关联事件2"]
+```json
+{{"p1": {{"topics": ["关键词1", "关键词2"], "sentiment": "<整体情绪倾向>", "style": "<语言风格>", "related_events": ["关联事件1"]}}}}
 ```
 
-重要！请确保：
-- 使用英文双引号包裹字符串；
-- 每个字段独占一行；
-- 每行冒号后保留一个空格；
-- 列表使用方括号 `[ ]` 包裹；
-- 不要使用中文符号（如 `。`、`、`、`“”`）；
-- 如果有换行文本字段，请用 `|` 表示多行字符串，并保持 4 空格缩进；
+重要！请确保每条帖子都有对应的结果，且只返回上述 JSON 对象。
 """
 
-        response,success = call_llm(prompt, logger )
-        logger.info(f"LLM 响应: {response}")
-        if "```yaml" not in response:
-            logger.error("LLM 响应格式不正确，请检查你的响应格式。")
-            return {"action": "finish", "reason": "LLM 响应格式不正确"}
-        try:
-            yaml_str = response.replace("\"", "").replace("\'", "").replace("\n", "").split("```yaml")[1].split("```")[0].strip()
-            yaml_str = yaml_str.replace("。", ".").replace("，", ",").replace("：", ":").replace("“", '"').replace("”",'"')
-            # 插入换行符，强制每行一个字段
-            yaml_str = re.sub(r'(sentiment:|style:|related_events:)', r'\n\1', yaml_str)
 
+def parse_batch_evaluation(data):
+    """从批量评估的解析结果中取出 {id: 评估结果}，只包含字段完整的条目"""
+    results = {}
+    for post_id, item in data.items():
+        if isinstance(item, dict) and all(field in item for field in EVALUATION_FIELDS):
+            results[str(post_id)] = {field: item[field] for field in EVALUATION_FIELDS}
+    return results
+
+
+class EvaluationBatcher:
+    """将多个分析线程中同时等待评估的帖子合并为一次模型请求
+
+    凑满 batch_size 条或首条等待超过 wait 秒后发送；
+    批量结果中缺失或无法解析的帖子返回 None，由调用方改为单独评估
+    """
+
+    def __init__(self, batch_size, wait):
+        self.batch_size = batch_size
+        self.wait = wait
+        self._lock = threading.Lock()
+        self._items = []
+        self._timer = None
+
+    def evaluate(self, post, context, logger):
+        future = Future()
+        with self._lock:
+            self._items.append((post, context, logger, future))
+            full = len(self._items) >= self.batch_size
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.wait, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self._flush()
+        return future.result()
+
+    def _flush(self):
+        with self._lock:
+            items, self._items = self._items, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not items:
+            return
+        if len(items) == 1:
+            items[0][3].set_result(None)
+            return
+        logger = items[0][2]
+        keyed = [(f"p{i + 1}", post, context) for i, (post, context, _, _) in enumerate(items)]
+        results = {}
+        try:
+            logger.info(f"批量评估 {len(items)} 条帖子")
+            # 与其他结构化调用一样使用 JSON 模式、有限次数的重试与解析统计
+            data = structured_call(batch_evaluation_prompt(keyed), "batch_evaluate", logger)
+            if data is not None:
+                results = parse_batch_evaluation(data)
         except Exception as e:
-            logger.error(f"处理 LLM 响应时发生错误: {e}")
-            return {"action": "finish", "reason": "LLM 响应格式不正确"}
-        decision = yaml.safe_load(yaml_str)
+            logger.error(f"批量评估失败，改为逐条评估: {e}")
+        missing = 0
+        for (post_id, _, _), (_, _, _, future) in zip(keyed, items):
+            missing += post_id not in results
+            future.set_result(results.get(post_id))
+        if missing:
+            logger.warning(f"批量评估中 {missing} 条帖子缺少结果，改为逐条评估")
 
-        return decision
 
-    def post(self, shared, prep_res, exec_res):
-        """
-        将最终文章存储在共享数据中
-        """
-        shared["post_evaluate"] = exec_res
-        logger = shared["logger"]
-        logger.info(f"===内容评估完成===")
-        return "evaluate"
+evaluation_batcher = EvaluationBatcher(EVAL_BATCH_SIZE, EVAL_BATCH_WAIT)
+
+
+# 无意义回答的明显标记；"42" 等数字会误伤正常内容（年份、条款编号），不作为标记
+NONSENSE_MARKERS = [
+    "coffee break",
+    "purple unicorns",
+    "made up",
+    "Who knows?"
+]
+NONSENSE_PATTERNS = [re.compile(rf"(?<!\w){re.escape(marker)}(?!\w)") for marker in NONSENSE_MARKERS]
+
+
+def _text_values(value):
+    """遍历评估结果中的所有字符串值，不包括字段名"""
+    if isinstance(value, dict):
+        for item in value.values():
+            yield from _text_values(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _text_values(item)
+    elif isinstance(value, str):
+        yield value
 
 
 # 监督节点
+@traced_node
 class SupervisorNode(Node):
     def prep(self, shared):
         """获取当前回答以进行评估。"""
         return shared["post_evaluate"], shared["logger"]
 
+    @staticmethod
+    def is_complete(post_evaluate):
+        return isinstance(post_evaluate, dict) and all(post_evaluate.get(field) is not None for field in EVALUATION_FIELDS)
+
     def exec(self, inputs):
         """检查回答是否有效或无意义。"""
         post_evaluate, logger = inputs
         logger.info(f"监督员正在检查回答质量...")
 
-        # 检查无意义回答的明显标记
-        nonsense_markers = [
-            "coffee break",
-            "purple unicorns",
-            "made up",
-            "42",
-            "Who knows?"
-        ]
-
-        # 检查回答是否包含任何无意义标记
-        is_nonsense = any(marker in post_evaluate for marker in nonsense_markers)
+        # 检查回答是否在某个字段值中以完整词语的形式包含无意义标记
+        is_nonsense = any(pattern.search(text) for pattern in NONSENSE_PATTERNS
+                          for text in _text_values(post_evaluate))
 
+        if not self.is_complete(post_evaluate):
+            return {"valid": False, "reason": "评估结果缺少字段或无法解析"}
         if is_nonsense:
             return {"valid": False, "reason": "回答似乎无意义或无帮助"}
         else:
@@ -133,14 +287,130 @@ class SupervisorNode(Node):
             logger.info(f"监督员批准了回答: {exec_res['reason']}")
             return "approved"
         else:
+            retries = shared.get("evaluate_retries", 0)
+            if retries >= SUPERVISOR_MAX_RETRIES:
+                # 重试次数用尽，保留最后一次的结果结束流程
+                logger.warning(f"监督员拒绝了回答: {exec_res['reason']}，已重试 {retries} 次，不再重试")
+                return "approved"
             logger.info(f"监督员拒绝了回答: {exec_res['reason']}")
+            shared["evaluate_retries"] = retries + 1
             # 清理错误的回答
             shared["post_evaluate"] = None
             # 添加关于被拒绝回答的注释
-            context = shared.get("post_evaluate", "")
-            shared["post"] = context + "\n\n注意: 之前的回答尝试被监督员拒绝了。"
+            shared["post"] = shared["post"] + "\n\n注意: 之前的回答尝试被监督员拒绝了。"
 
             return "retry"
 
 
 
+
+
+if JSON_MODE:
+    FAST_EVALUATION_FORMAT = """## 返回格式
+
+只返回一个 JSON 对象：
+
+```json
+{"action": "evaluate 或 search", "search_queries": ["搜索查询1", "搜索查询2"], "topics": ["关键词1", "关键词2"], "sentiment": "<整体情绪倾向>", "style": "<语言风格>", "related_events": ["关联事件1", "关联事件2"]}
+```
+"""
+else:
+    FAST_EVALUATION_FORMAT = """## 返回格式
+
+```yaml
+action: evaluate OR search
+search_queries: ["搜索查询1", "搜索查询2"]
+topics: ["关键词1" ,"关键词2"]
+sentiment: <整体情绪倾向>
+style: <语言风格>
+related_events: ["关联事件1","关联事件2"]
+```
+
+重要！请确保：
+- 使用英文双引号包裹字符串；
+- 每个字段独占一行；
+- 每行冒号后保留一个空格；
+- 列表使用方括号 `[ ]` 包裹；
+- 不要使用中文符号（如 `。`、`、`、`“”`）；
+"""
+
+
+@traced_node
+class FastEvaluate(Node):
+    """快速模式：用一次调用同时完成是否需要搜索的决策与帖子评估
+
+    背景信息足够或搜索轮数用尽时直接给出评估结果；否则给出搜索查询，
+    由 SearchWeb 搜索一轮后再次评估
+    """
+
+    def prep(self, shared):
+        search_rounds = shared.get("fast_search_rounds", 0)
+        can_search = search_rounds < shared.get("max_search_rounds", FAST_SEARCH_ROUNDS)
+        return (shared["user_name"], shared["create_time"], shared["post"], shared.get("context", "无先前搜索"),
+                can_search, shared["logger"])
+
+    def exec(self, inputs):
+        user_name, create_time, post, context, can_search, logger = inputs
+        search_option = """
+## 操作
+- 如果不了解帖子提到的事件，无法判断 related_events，可以进行一次网络搜索：
+  action 返回 search，并在 search_queries 中给出最多3条搜索查询，其余字段留空
+- 否则 action 返回 evaluate，并给出分析结果
+""" if can_search else """
+## 操作
+- 直接给出分析结果，action 返回 evaluate
+"""
+        prompt = f"""
+你是一个专业的内容分析师，结合内容背景并参考分析维度，对社交媒体的帖子内容进行分析
+
+## 上下文
+- 社媒名人名称: {user_name}
+- 发布时间： {create_time}
+
+{post}
+
+- 内容背景：
+{context}
+{search_option}
+## 分析维度
+topics：提取帖子中最能概括核心内容的关键词或话题标签，要求覆盖核心语义，数量不限
+
+sentiment：判断帖子的整体情感倾向，取值包括 positive、negative、neutral、mixed
+
+style：分析帖子的语言风格，常见类型：formal、informal、humorous、sarcastic、aggressive、inspirational
+
+related_events：识别帖子关联的现实事件或热点话题，无则返回无热点事件。
+
+{FAST_EVALUATION_FORMAT}"""
+        for attempt in range(FAST_EVALUATE_RETRIES + 1):
+            decision = structured_call(prompt, "fast_evaluate", logger, repair=repair_evaluation)
+            logger.info(f"LLM 响应: {decision}")
+            if decision is None:
+                return {"action": "finish", "reason": "LLM 响应格式不正确"}
+            if decision.get("action") == "search" and can_search:
+                queries = decision.get("search_queries") or []
+                queries = [queries] if isinstance(queries, str) else [str(q).strip() for q in queries if q]
+                if queries:
+                    return {"action": "search", "search_queries": queries[:3]}
+            post_evaluate = {field: decision.get(field) for field in EVALUATION_FIELDS}
+            if SupervisorNode.is_complete(post_evaluate):
+                return {"action": "evaluate", "post_evaluate": post_evaluate}
+            # 修改提示词后重新请求，避免命中缓存中的同一响应
+            logger.warning(f"快速评估结果缺少字段: {post_evaluate}")
+            prompt += "\n\n注意: 之前的回答缺少字段，请完整给出 topics、sentiment、style、related_events。"
+        return {"action": "finish", "reason": "评估结果缺少字段"}
+
+    def post(self, shared, prep_res, exec_res):
+        logger = shared["logger"]
+        if exec_res["action"] == "search":
+            shared["fast_search_rounds"] = shared.get("fast_search_rounds", 0) + 1
+            shared["search_queries"] = exec_res["search_queries"]
+            shared["search_query"] = "；".join(exec_res["search_queries"])
+            logger.info(f"🔍 快速模式搜索: {exec_res['search_queries']}")
+            return "search"
+        if exec_res["action"] == "evaluate":
+            shared["post_evaluate"] = exec_res["post_evaluate"]
+            logger.info(f"===内容评估完成===")
+        else:
+            logger.warning(f"快速评估未完成: {exec_res['reason']}")
+        return exec_res["action"]
@@ -1,16 +1,144 @@
 # 导入所需库
 import os
+import threading
 
 import requests  # 用于发起 HTTP 请求获取网页内容
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup  # 用于解析 HTML 页面结构
 from urllib.parse import urljoin, urlparse  # 用于处理 URL 拼接与解析
 from typing import Dict, List, Set, Any  # 类型提示，提高代码可读性
 from dotenv import load_dotenv
 
+from agent.utils.cache import DiskCache
+from agent.utils.concurrency import backend_limit
+from agent.utils.trace import annotate, traced
+
 load_dotenv()
 
 __all__ = ["WebCrawler"]
 
+# 单个页面最多读取的字节数，超出部分直接丢弃
+MAX_PAGE_BYTES = int(os.getenv("CRAWL_MAX_BYTES", 2 * 1024 * 1024))
+# 返回的正文最大字符数，analyze_content 只使用前2000个字符
+MAX_TEXT_CHARS = int(os.getenv("CRAWL_MAX_TEXT_CHARS", 4000))
+# 只解析网页类内容，跳过 PDF、图片、视频等
+ALLOWED_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+# 非正文标签，提取文本前移除
+NOISE_TAGS = ["script", "style", "noscript", "nav", "header", "footer", "aside", "form", "iframe", "svg"]
+
+try:
+    import lxml  # noqa: F401  C 实现的解析器，比 html.parser 快数倍
+
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+_session = None
+_session_lock = threading.Lock()
+
+# 已提取的页面正文缓存，默认保留7天
+page_cache = DiskCache("pages", ttl=int(os.getenv("PAGE_CACHE_TTL", 7 * 24 * 3600)),
+                       max_entries=int(os.getenv("PAGE_CACHE_MAX_ENTRIES", 50000)))
+# 抓取失败的网址与域名，在有效期内（默认6小时）不再重试
+failure_cache = DiskCache("page_failures", ttl=int(os.getenv("PAGE_FAILURE_TTL", 6 * 3600)))
+# 同一域名失败达到该次数后，整个域名暂时跳过
+DOMAIN_FAILURE_LIMIT = int(os.getenv("CRAWL_DOMAIN_FAILURES", 3))
+
+
+def get_proxies():
+    proxy_url = os.getenv("PROXY_URL")
+    proxies = None
+    if proxy_url:
+        if proxy_url.startswith("socks5://"):
+            # 使用 socks5 代理
+            # 使用 socks5 代理，确保 DNS 也走代理
+            proxies = {
+                "http": f"socks5h://{proxy_url[len('socks5://'):]}",
+                "https": f"socks5h://{proxy_url[len('socks5://'):]}",
+            }
+
+        else:
+            # 普通 http/https 代理
+            proxies = {
+                "http": proxy_url,
+                "https": proxy_url
+            }
+    return proxies
+
+
+def get_session() -> requests.Session:
+    """所有爬虫实例共享的连接池会话"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+                "Accept-Language": "en-US,en;q=0.5",
+                "Referer": "https://www.google.com/",
+                "Connection": "keep-alive"
+            })
+            session.proxies = get_proxies() or {}
+            _session = session
+        return _session
+
+
+def fetch_html(url: str):
+    """流式下载网页，超过 MAX_PAGE_BYTES 时提前中止
+
+    返回:
+        tuple: (网页字节, 响应头声明的编码)；非网页内容返回 (None, None)
+    """
+    with get_session().get(url, timeout=10, stream=True) as response:
+        response.raise_for_status()  # 如果响应状态码不是 200，抛出异常
+
+        content_type = response.headers.get("Content-Type", "").lower()
+        if content_type and not content_type.startswith(ALLOWED_CONTENT_TYPES):
+            print(f"跳过非网页内容 {url}: {content_type}")
+            return None, None
+
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= MAX_PAGE_BYTES:
+                print(f"页面超过 {MAX_PAGE_BYTES} 字节，已截断: {url}")
+                break
+        # 只有响应头明确声明 charset 时才使用，否则交给 BeautifulSoup 根据 meta 判断
+        encoding = response.encoding if "charset" in content_type else None
+        return b"".join(chunks), encoding
+
+
+def is_known_failure(url: str) -> bool:
+    """网址或其域名近期抓取失败过"""
+    if failure_cache.get(f"url:{url}") is not None:
+        return True
+    domain_failures = failure_cache.get(f"domain:{urlparse(url).netloc}")
+    return domain_failures is not None and domain_failures >= DOMAIN_FAILURE_LIMIT
+
+
+def record_failure(url: str, reason: str, error: Exception = None) -> None:
+    """记录失败的网址；超时、连接失败、403/429/5xx 同时计入域名失败次数"""
+    failure_cache.set(f"url:{url}", reason)
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(error, (requests.Timeout, requests.ConnectionError)) or status in (403, 429) or (status or 0) >= 500:
+        domain_key = f"domain:{urlparse(url).netloc}"
+        failure_cache.set(domain_key, (failure_cache.get(domain_key) or 0) + 1)
+
+
+def extract_main_text(soup: BeautifulSoup) -> str:
+    """移除导航、脚本等噪声，优先提取 article/main 中的正文"""
+    for tag in soup(NOISE_TAGS):
+        tag.decompose()
+    container = soup.find("article") or soup.find("main") or soup.find(attrs={"role": "main"}) or soup.body or soup
+    text = container.get_text(separator="\n", strip=True)
+    return text[:MAX_TEXT_CHARS]
+
 
 class WebCrawler:
     """WebCrawler 是一个简单的网页爬虫类，用于抓取指定网站的内容并提取文本、链接等信息。
@@ -55,52 +183,43 @@ class WebCrawler:
         返回:
             Dict: 包含页面信息的字典，如标题、正文、链接等；失败时返回 None
         """
-        try:
-            proxy_url = os.getenv("PROXY_URL")
-            proxies = None
-            if proxy_url:
-                if proxy_url.startswith("socks5://"):
-                    # 使用 socks5 代理
-                    # 使用 socks5 代理，确保 DNS 也走代理
-                    proxies = {
-                        "http": f"socks5h://{proxy_url[len('socks5://'):]}",
-                        "https": f"socks5h://{proxy_url[len('socks5://'):]}",
-                    }
-
-                else:
-                    # 普通 http/https 代理
-                    proxies = {
-                        "http": proxy_url,
-                        "https": proxy_url
-                    }
-
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-                "Accept-Language": "en-US,en;q=0.5",
-                "Referer": "https://www.google.com/",
-                "Connection": "keep-alive"
-            }
+        cached = page_cache.get(url)
+        if cached is not None:
+            print(f"命中页面缓存: {url}")
+            annotate(cache_hit=True)
+            return cached
+        if is_known_failure(url):
+            print(f"近期抓取失败，跳过: {url}")
+            annotate(cache_hit=True, known_failure=True)
+            return None
+        annotate(cache_hit=False)
 
-            response = requests.get(url, headers=headers, proxies=proxies, timeout=10)
-            response.raise_for_status()  # 如果响应状态码不是 200，抛出异常
+        try:
+            with backend_limit("crawl"):
+                html_bytes, encoding = fetch_html(url)
+            if html_bytes is None:
+                record_failure(url, "非网页内容")
+                return None
 
-            soup = BeautifulSoup(response.text, "html.parser")  # 解析 HTML 内容
+            soup = BeautifulSoup(html_bytes, HTML_PARSER, from_encoding=encoding)  # 解析 HTML 内容
 
             # 构建包含页面信息的字典
             content = {
                 "url": url,  # 当前页面 URL
                 "title": soup.title.string if soup.title else "",  # 页面标题
-                "text": soup.get_text(separator="\n", strip=True),  # 页面正文内容，用换行分隔并去除空白
+                "text": extract_main_text(soup),  # 页面正文内容，仅保留主体文本
                 # "links": []  # 存储提取到的链接
             }
 
+            page_cache.set(url, content)
             return content
 
         except Exception as e:
             print(f"爬取 {url} 时发生错误: {str(e)}")
+            record_failure(url, str(e), e)
             return None
 
+    @traced("crawl")
     def crawl(self) -> List[Dict]:
         """开始爬取流程，从 base_url 开始，逐步爬取相关页面
 
@@ -132,14 +251,4 @@ class WebCrawler:
 
 
 if __name__ == "__main__":
-    proxy_url = os.getenv("PROXY_URL")
-    proxies = None
-    if proxy_url.startswith("socks5://"):
-        # 使用 socks5 代理
-        # 使用 socks5 代理，确保 DNS 也走代理
-        proxies = {
-            "http": f"socks5h://{proxy_url[len('socks5://'):]}",
-            "https": f"socks5h://{proxy_url[len('socks5://'):]}",
-        }
-    print(proxies)
-
+    print(get_proxies())
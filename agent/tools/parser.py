@@ -1,9 +1,24 @@
+import os
 import re
 from typing import Dict, List
+from agent.utils.cache import DiskCache, cache_key
 from agent.utils.call_llm import call_llm
+from agent.utils.trace import traced, annotate
 
 __all__ = [ "analyze_content", "analyze_site"]
 
+# 网页总结按 网址 + 内容哈希 缓存，同一篇文章出现在多个帖子中时只总结一次
+summary_cache = DiskCache("summaries", ttl=int(os.getenv("SUMMARY_CACHE_TTL", 30 * 24 * 3600)),
+                          max_entries=int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", 50000)))
+
+ANALYSIS_ERROR = {
+    "summary": "分析网页内容时出错",
+    "topics": [],
+    "content_type": "未知"
+}
+
+
+@traced("analyze_content")
 def analyze_content(content: Dict,logger) -> Dict:
     """使用大语言模型分析网页内容
 
@@ -13,6 +28,13 @@ def analyze_content(content: Dict,logger) -> Dict:
     返回:
         Dict: 包含总结和主题的分析结果
     """
+    key = cache_key(content['url'], content['title'], content['text'][:2000])
+    cached = summary_cache.get(key)
+    annotate(cache_hit=cached is not None)
+    if cached is not None:
+        logger.info(f"命中网页总结缓存: {content['url']}")
+        return cached
+
     prompt = f"""
 ## 请分析以下网页内容：
 
@@ -44,12 +66,12 @@ content_type: <填写内容类型>
         response,success = call_llm(prompt,logger=logger)
         if not success:
             logger.error("LLM 响应失败，请检查你的响应格式。")
-            return {"action": "finish", "reason": "LLM 响应失败"}
+            return dict(ANALYSIS_ERROR)
 
         # 提取代码块中的YAML内容
         if "```yaml" not in response:
             logger.error("LLM 响应格式不正确，请检查你的响应格式。")
-            return {"action": "finish", "reason": "LLM 响应格式不正确"}
+            return dict(ANALYSIS_ERROR)
         yaml_str = response.split("```yaml")[1].split("```")[0].strip()
         import yaml
         analysis = yaml.safe_load(yaml_str)
@@ -60,15 +82,12 @@ content_type: <填写内容类型>
         assert "content_type" in analysis
         assert isinstance(analysis["topics"], list)
 
+        summary_cache.set(key, analysis)
         return analysis
 
     except Exception as e:
         print(f"分析网页内容时出错: {str(e)}")
-        return {
-            "summary": "分析网页内容时出错",
-            "topics": [],
-            "content_type": "未知"
-        }
+        return dict(ANALYSIS_ERROR)
 
 
 def analyze_site(crawl_results: List[Dict],logger) -> List[Dict]:
@@ -1,23 +1,56 @@
 from io import BytesIO
-from time import sleep
 
 from duckduckgo_search import DDGS
 import requests
 import os
 
 from dotenv import load_dotenv
+
+from agent.utils.cache import DiskCache, cache_key
+from agent.utils.concurrency import backend_limit
+from agent.utils.rate_limit import TokenBucket
+from agent.utils.trace import span
+
 load_dotenv()
 
 __all__=["search_web"]
-# 设置代理
+# 设置代理，未配置 PROXY_URL 时直连
 proxies = {
     "http": f"{os.getenv('PROXY_URL')}",
     "https": f"{os.getenv('PROXY_URL')}",
-}
+} if os.getenv('PROXY_URL') else None
+
+# serper.dev 接口地址，离线测试时可指向本地的 fake_services.py
+SERPER_API_URL = os.getenv("SERPER_API_URL", "https://google.serper.dev/search")
 
 search_web_call_count = 0
-#
+
+# 相同查询词的搜索结果默认缓存1天
+search_cache = DiskCache("search", ttl=int(os.getenv("SEARCH_CACHE_TTL", 24 * 3600)),
+                         max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 50000)))
+# serper.dev 限流：默认每5秒补充1次调用，最多连续3次，只有超出配额时才等待
+serper_bucket = TokenBucket(rate=float(os.getenv("SEARCH_RATE_PER_SEC", 0.2)),
+                            capacity=int(os.getenv("SEARCH_BURST", 3)))
+
+
 def search_web(query,  logger,num_results=3):
+    api_key = os.getenv("SERPAPI_API_KEY", None)
+    with span("search_web", query=query) as record:
+        key = cache_key("serper" if api_key else "duckduckgo", query, num_results)
+        cached = search_cache.get(key)
+        if cached is not None:
+            logger.info(f"[SearchWeb] 命中搜索缓存，查询词: {query}")
+            record.update(cache_hit=True, results=len(cached[1]))
+            return cached[0], cached[1]
+
+        results_str, results_dict = _search_web(query, logger, num_results)
+        record.update(cache_hit=False, results=len(results_dict or []))
+        if results_dict:
+            search_cache.set(key, [results_str, results_dict])
+        return results_str, results_dict
+
+
+def _search_web(query,  logger,num_results=3):
     try:
         # 使用serper.dev进行网络搜索
         # logger.info(f"## 查询: {query}")
@@ -26,10 +59,12 @@ def search_web(query,  logger,num_results=3):
         if api_key:
             global search_web_call_count
             search_web_call_count += 1
-            sleep(5)
+            waited = serper_bucket.acquire()
+            if waited:
+                logger.info(f"[SearchWeb] 搜索配额限流，等待 {waited:.1f} 秒")
             logger.info(f"[SearchWeb] 第 {search_web_call_count} 次调用，查询词: {query}")
 
-            url = "https://google.serper.dev/search"
+            url = SERPER_API_URL
             headers = {
                 "X-API-KEY": api_key,
                 "Content-Type": "application/json"
@@ -39,7 +74,8 @@ def search_web(query,  logger,num_results=3):
                 "engine": "google",
                 "num": num_results
             }
-            response = requests.post(url, headers=headers, json=payload, proxies=proxies)
+            with backend_limit("search"):
+                response = requests.post(url, headers=headers, json=payload, proxies=proxies)
             if response.status_code == 200:
                 results = response.json().get("organic", [])
                 results_str = "\n\n".join(
@@ -52,7 +88,7 @@ def search_web(query,  logger,num_results=3):
         else:
             logger.info(f"使用DuckDuckgo免费搜索进行查询")
 
-            with DDGS(proxy=os.getenv("PROXY_URL"), timeout=20) as ddgs:
+            with backend_limit("search"), DDGS(proxy=os.getenv("PROXY_URL"), timeout=20) as ddgs:
                 news_results = ddgs.text(query, max_results=num_results)
                 # Convert results to a string
                 results_str = "\n\n".join(
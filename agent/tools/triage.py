@@ -0,0 +1,68 @@
+import os
+import re
+
+__all__ = ["triage_post", "DEFAULT_RESULT", "SKIP_CONTEXT", "EVALUATE_CONTEXT"]
+
+# 有效字符数低于 TRIAGE_MIN_CHARS 的帖子直接跳过；
+# 含有实体（话题标签、提及、专有名词、数字）或有效字符数达到 TRIAGE_RESEARCH_CHARS 的帖子进行完整的背景调查
+TRIAGE_ENABLED = os.getenv("TRIAGE", "1") != "0"
+TRIAGE_MIN_CHARS = int(os.getenv("TRIAGE_MIN_CHARS", 4))
+TRIAGE_RESEARCH_CHARS = int(os.getenv("TRIAGE_RESEARCH_CHARS", 40))
+
+# 跳过的帖子使用的默认分析结果，字段与 PostEvaluate 的输出一致
+DEFAULT_RESULT = {
+    "topics": [],
+    "sentiment": "neutral",
+    "style": "informal",
+    "related_events": ["无热点事件"],
+}
+SKIP_CONTEXT = "帖子无有效文本内容，未进行分析。"
+EVALUATE_CONTEXT = "帖子信息量较少，未进行背景调查。"
+
+_LABEL_PATTERN = re.compile(r"帖子\S{0,6}：")
+_URL_PATTERN = re.compile(r"https?://\S+")
+_MEANINGFUL_PATTERN = re.compile(r"[0-9A-Za-z一-龥]")
+_CJK_PATTERN = re.compile(r"[一-龥]")
+_ENTITY_PATTERNS = [
+    re.compile(r"#\w+"),                   # 话题标签
+    re.compile(r"@\w+"),                   # 提及
+    re.compile(r"(?<![.!?]\s)(?<!^)\b[A-Z][a-zA-Z]{2,}"),  # 句中大写的专有名词
+    re.compile(r"\b\d{2,}\b"),             # 年份、数量等数字
+]
+
+
+def _features(input_content: str) -> dict:
+    text = _URL_PATTERN.sub(" ", _LABEL_PATTERN.sub(" ", str(input_content))).strip()
+    meaningful = _MEANINGFUL_PATTERN.findall(text)
+    cjk = len(_CJK_PATTERN.findall(text))
+    entities = set()
+    for pattern in _ENTITY_PATTERNS:
+        entities.update(pattern.findall(text))
+    if not meaningful:
+        language = "none"
+    else:
+        language = "zh" if cjk * 2 >= len(meaningful) else "en"
+    return {"chars": len(meaningful), "language": language, "entities": len(entities)}
+
+
+def triage_post(input_content: str):
+    """根据帖子文本的简单特征决定分析方式，不调用模型
+
+    参数:
+        input_content (str): build_input_content 生成的帖子内容
+
+    返回:
+        tuple: (route, reason)，route 为
+            - full: 背景调查 + 内容评估
+            - evaluate: 只进行内容评估
+            - skip: 不调用模型，使用 DEFAULT_RESULT
+    """
+    if not TRIAGE_ENABLED:
+        return "full", "未启用预分类"
+    features = _features(input_content)
+    reason = f"有效字符 {features['chars']}，语言 {features['language']}，实体 {features['entities']}"
+    if features["chars"] < TRIAGE_MIN_CHARS:
+        return "skip", reason
+    if features["entities"] > 0 or features["chars"] >= TRIAGE_RESEARCH_CHARS:
+        return "full", reason
+    return "evaluate", reason
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+__all__ = ["DiskCache", "cache_key", "file_hash", "cache_stats"]
+
+# 所有缓存共用一个 SQLite 文件，按 namespace 区分
+CACHE_PATH = os.path.join(os.getenv("CACHE_DIR", "./cache"), "agent_cache.sqlite3")
+CACHE_ENABLED = os.getenv("AGENT_CACHE", "1") != "0"
+
+_instances = []
+
+
+def cache_key(*parts) -> str:
+    """将多个字段拼接后计算 sha256，作为缓存键"""
+    m = hashlib.sha256()
+    for part in parts:
+        m.update(str(part).encode("utf-8"))
+        m.update(b"\x00")
+    return m.hexdigest()
+
+
+def file_hash(path: str) -> str:
+    """计算文件内容的 sha256，用于图片等二进制输入的缓存键"""
+    m = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            m.update(chunk)
+    return m.hexdigest()
+
+
+def cache_stats() -> dict:
+    """返回所有缓存的命中统计，用于任务结束时输出"""
+    return {cache.namespace: cache.stats() for cache in _instances}
+
+
+class DiskCache:
+    """基于 SQLite 的持久化键值缓存，多线程共享
+
+    - 值以 JSON 形式存储
+    - ttl: 过期时间（秒），为 None 时不过期
+    - max_entries: 条目数上限，超出时淘汰最久未访问的条目
+    """
+
+    def __init__(self, namespace: str, ttl: int = None, max_entries: int = None, path: str = CACHE_PATH):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        _instances.append(self)
+
+    def _conn(self) -> sqlite3.Connection:
+        # 每个线程使用独立连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "namespace TEXT, key TEXT, value TEXT, created_at REAL, accessed_at REAL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        """读取缓存，未命中或已过期时返回 None"""
+        if not CACHE_ENABLED:
+            return None
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value, created_at FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+        ).fetchone()
+        now = time.time()
+        if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+            with self._lock:
+                self.misses += 1
+            if row is not None:
+                self.delete(key)
+            return None
+        conn.execute(
+            "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?", (now, self.namespace, key)
+        )
+        conn.commit()
+        with self._lock:
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value) -> None:
+        """写入缓存"""
+        if not CACHE_ENABLED:
+            return
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (namespace, key, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (self.namespace, key, json.dumps(value, ensure_ascii=False), now, now),
+        )
+        conn.commit()
+        with self._lock:
+            self._writes += 1
+            evict = self.max_entries is not None and self._writes % 100 == 0
+        if evict:
+            self.evict()
+
+    def delete(self, key: str) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+        conn.commit()
+
+    def evict(self) -> None:
+        """删除过期条目，并按最久未访问淘汰超出上限的条目"""
+        conn = self._conn()
+        if self.ttl is not None:
+            conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND created_at < ?", (self.namespace, time.time() - self.ttl)
+            )
+        if self.max_entries is not None:
+            conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key IN ("
+                "SELECT key FROM cache WHERE namespace = ? ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.namespace, self.namespace, self.max_entries),
+            )
+        conn.commit()
+
+    def stats(self) -> dict:
+        """命中次数、未命中次数与命中率"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
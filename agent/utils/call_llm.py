@@ -1,6 +1,16 @@
 import os
-from asyncio import sleep
+import json
+import time
+import atexit
+import asyncio
+import threading
+import httpx
 from dotenv import load_dotenv
+
+from agent.utils.cache import DiskCache, cache_key, file_hash
+from agent.utils.concurrency import async_backend_limit
+from agent.utils.trace import span
+
 load_dotenv()
 
 # 设置代理
@@ -9,26 +19,238 @@ proxies = {
     "https": f"{os.getenv('PROXY_URL')}",
 }
 
-__all__ =["call_llm"]
+__all__ =["call_llm", "acall_llm", "llm_cache", "stream_stats"]
+
+# 相同模型 + 相同提示词 + 相同图片的响应直接复用，默认保留30天
+llm_cache = DiskCache(
+    "llm",
+    ttl=int(os.getenv("LLM_CACHE_TTL", 30 * 24 * 3600)),
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", 100000)),
+)
+
+# 连接超时与读取超时（秒），本地大模型生成较慢，读取超时默认放宽
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 10))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", 300))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 32))
+
+# 流式读取模型输出，```yaml 代码块闭合后立即断开连接，不再等待模型继续生成解释文字
+LLM_STREAM = os.getenv("LLM_STREAM", "1") != "0"
+
+_stream_stats = {"calls": 0, "early_stops": 0, "ttft_total": 0.0, "duration_total": 0.0}
+_stats_lock = threading.Lock()
+
+# 所有模型请求都在同一个后台事件循环中执行，共用一个连接池
+_loop = None
+_client = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-loop", daemon=True).start()
+        return _loop
+
+
+def _get_client() -> httpx.AsyncClient:
+    # 只在后台事件循环中调用
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+        )
+    return _client
+
 
-def call_llm(prompt, logger=None, image_path='', ):
-    if os.getenv("CLOUD_MODEL_NAME") != '' and image_path != "":
+@atexit.register
+def _close_client():
+    if _client is not None and _loop is not None and _loop.is_running():
+        try:
+            asyncio.run_coroutine_threadsafe(_client.aclose(), _loop).result(timeout=5)
+        except Exception:
+            pass
+
+
+def stream_stats() -> dict:
+    """流式调用次数、提前结束次数、平均首个 token 耗时与平均总耗时（秒），用于任务结束时输出"""
+    with _stats_lock:
+        calls = _stream_stats["calls"]
+        return {
+            "calls": calls,
+            "early_stops": _stream_stats["early_stops"],
+            "avg_ttft": round(_stream_stats["ttft_total"] / calls, 3) if calls else 0.0,
+            "avg_duration": round(_stream_stats["duration_total"] / calls, 3) if calls else 0.0,
+        }
+
+
+def _yaml_block_closed(text: str) -> bool:
+    # 批量评估返回 ```json 代码块，同样在闭合后结束
+    for fence in ("```yaml", "```json"):
+        start = text.find(fence)
+        if start >= 0 and text.find("```", start + len(fence)) >= 0:
+            return True
+    return False
+
+
+class _JsonEndTracker:
+    """逐 token 扫描 JSON 模式的输出，顶层对象或数组的括号配平后即视为完整"""
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escape = False
+
+    def feed(self, token: str) -> bool:
+        for ch in token:
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = self.started
+            elif ch in "{[":
+                self.depth += 1
+                self.started = True
+            elif ch in "}]" and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
+
+async def _stream_completion(url, payload, logger, headers=None, sse=False):
+    """流式请求模型，返回 (状态码, 文本)
+
+    - sse 为 False 时按 Ollama 的逐行 JSON 解析，为 True 时按 OpenAI 兼容接口的 SSE 解析
+    - YAML 代码块闭合后退出上下文，关闭连接以取消服务端的生成
+    - JSON 模式（Ollama format=json 或 response_format）的输出没有代码块，顶层 JSON 配平后同样提前结束
+    """
+    start = time.monotonic()
+    ttft = None
+    early_stop = False
+    chunks = []
+    json_tracker = _JsonEndTracker() if payload.get("format") == "json" or payload.get("response_format") else None
+    async with _get_client().stream("POST", url, json=payload, headers=headers) as response:
+        if response.status_code != 200:
+            await response.aread()
+            return response.status_code, ""
+        async for line in response.aiter_lines():
+            if sse:
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                token = (choices[0].get("delta") or {}).get("content") or ""
+            else:
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                token = data.get("response", "")
+                if data.get("done"):
+                    chunks.append(token)
+                    break
+            if token and ttft is None:
+                ttft = time.monotonic() - start
+            chunks.append(token)
+            if json_tracker is not None:
+                if token and json_tracker.feed(token):
+                    early_stop = True
+                    break
+            elif token and "`" in token and _yaml_block_closed("".join(chunks)):
+                early_stop = True
+                break
+    duration = time.monotonic() - start
+    with _stats_lock:
+        _stream_stats["calls"] += 1
+        _stream_stats["early_stops"] += early_stop
+        _stream_stats["ttft_total"] += ttft if ttft is not None else duration
+        _stream_stats["duration_total"] += duration
+    logger.info(f"流式响应: 首个token {ttft if ttft is not None else -1:.2f}s, 总耗时 {duration:.2f}s"
+                + (", 输出已完整，提前结束" if early_stop else ""))
+    return 200, "".join(chunks)
+
+
+def _use_cloud_model(image_path=''):
+    return os.getenv("CLOUD_MODEL_NAME") != '' and image_path != ""
+
+
+def _llm_cache_key(image_path='', json_mode=False):
+    model_name = os.getenv("CLOUD_MODEL_NAME") if _use_cloud_model(image_path) else os.getenv("LOCAL_MODEL_NAME")
+    return model_name, (file_hash(image_path) if image_path else "") + ("json" if json_mode else "")
+
+
+def call_llm(prompt, logger=None, image_path='', json_mode=False, validate=None):
+    """同步调用大模型，供分析线程使用
+
+    缓存在调用线程中读写，只有未命中时才把请求交给后台事件循环
+
+    参数:
+        json_mode (bool): 要求后端以 JSON 格式输出
+        validate (Callable[[str], bool]): 可选，只缓存通过校验的响应
+    """
+    with span("call_llm", prompt_chars=len(prompt), json_mode=json_mode, image=bool(image_path)) as record:
+        model_name, image_hash = _llm_cache_key(image_path, json_mode)
+        key = cache_key(model_name, prompt, image_hash)
+        cached = llm_cache.get(key)
+        if cached is not None:
+            logger.info(f"命中LLM缓存({model_name})")
+            record.update(cache_hit=True, response_chars=len(cached), success=True)
+            return cached, True
+
+        future = asyncio.run_coroutine_threadsafe(_dispatch_llm(prompt, logger, image_path, json_mode), _get_loop())
+        response, success = future.result()
+        record.update(cache_hit=False, response_chars=len(response or ""), success=bool(success))
+        if success and (validate is None or validate(response)):
+            llm_cache.set(key, response)
+        return response, success
+
+
+async def acall_llm(prompt, logger=None, image_path='', json_mode=False, validate=None):
+    """异步调用大模型，可在任意事件循环中 await
+
+    请求实际在后台事件循环中执行，以共用连接池与各后端的并发上限
+    """
+    model_name, image_hash = await asyncio.to_thread(_llm_cache_key, image_path, json_mode)
+    key = cache_key(model_name, prompt, image_hash)
+    cached = await asyncio.to_thread(llm_cache.get, key)
+    if cached is not None:
+        logger.info(f"命中LLM缓存({model_name})")
+        return cached, True
+
+    future = asyncio.run_coroutine_threadsafe(_dispatch_llm(prompt, logger, image_path, json_mode), _get_loop())
+    response, success = await asyncio.wrap_future(future)
+    if success and (validate is None or validate(response)):
+        await asyncio.to_thread(llm_cache.set, key, response)
+    return response, success
+
+
+async def _dispatch_llm(prompt, logger=None, image_path='', json_mode=False):
+    if _use_cloud_model(image_path):
         # 只有视觉的模型调用云端模型
         logger.info(f"使用云端模型{os.getenv('CLOUD_MODEL_NAME')}")
-        response,success = call_cloud_model(prompt, logger, image_path)
+        response,success = await call_cloud_model(prompt, logger, image_path, json_mode)
         return response,success
     if 'gemma3' in os.getenv("LOCAL_MODEL_NAME") and image_path != "":
         logger.info(f"使用本地模型{os.getenv('LOCAL_MODEL_NAME')}")
-        response,success = call_local_llm(prompt, logger, image_path)
+        response,success = await call_local_llm(prompt, logger, image_path, json_mode)
         return response,success
     elif 'gemma3' in os.getenv("LOCAL_MODEL_NAME") and image_path == "":
         logger.info(f"使用本地模型{os.getenv('LOCAL_MODEL_NAME')}")
-        response,success = call_local_llm(prompt, logger)
+        response,success = await call_local_llm(prompt, logger, json_mode=json_mode)
         return response,success
     return None, None
 
 
-def call_local_llm(prompt, logger=None, image_path='', ):
+async def call_local_llm(prompt, logger=None, image_path='', json_mode=False):
     # 支持视觉与非视觉模型  ·
     try:
         # logger.info(f"## 提示: {prompt}")
@@ -40,8 +262,8 @@ def call_local_llm(prompt, logger=None, image_path='', ):
             payload = {
                 "model": f"{os.getenv('LOCAL_MODEL_NAME')}",
                 "prompt": prompt,
-                "stream": False,
-                "image": convert_image_to_base64(image_path)
+                "stream": LLM_STREAM,
+                "image": await asyncio.to_thread(convert_image_to_base64, image_path)
             }
 
         if image_path == "":
@@ -49,9 +271,20 @@ def call_local_llm(prompt, logger=None, image_path='', ):
             payload = {
                 "model": f"{os.getenv('LOCAL_MODEL_NAME')}",
                 "prompt": prompt,
-                "stream": False
+                "stream": LLM_STREAM
             }
-        response = requests.post(url, json=payload)
+        if json_mode:
+            payload["format"] = "json"
+        if LLM_STREAM:
+            async with async_backend_limit("local_llm"):
+                status_code, text = await _stream_completion(url, payload, logger)
+            if status_code == 200:
+                logger.info(f"模型返回信息{text}")
+                return text, True
+            logger.error(f"错误: 无法从模型获取响应。状态码: {status_code}")
+            return "错误: 无法从模型获取响应。", False
+        async with async_backend_limit("local_llm"):
+            response = await _get_client().post(url, json=payload)
         if response.status_code == 200:
             logger.info(f"模型返回信息{response.json().get('response')}")
             return response.json().get("response", ""), True
@@ -59,12 +292,10 @@ def call_local_llm(prompt, logger=None, image_path='', ):
             logger.error(f"错误: 无法从模型获取响应。状态码: {response.status_code}")
             return "错误: 无法从模型获取响应。", False
     except Exception as e:
-        logger.error(f"调用LLM时发生异常: {e}")
+        logger.error(f"调用LLM时发生异常: {e!r}")
         return "错误: 调用LLM时发生异常。", False
 
 
-import os
-import requests
 from PIL import Image
 from io import BytesIO
 from base64 import b64encode
@@ -74,7 +305,7 @@ api_url = os.getenv("CLOUD_API_URL")
 MAX_RETRIES = 2
 
 
-def call_cloud_model(prompt, logger=None, image_path=''):
+async def call_cloud_model(prompt, logger=None, image_path='', json_mode=False):
     """评估图片与叙事的相关性，并对图片进行评分。
 
     Args:
@@ -94,19 +325,31 @@ def call_cloud_model(prompt, logger=None, image_path=''):
                 logger.info(f"使用云端模型{os.getenv('CLOUD_MODEL_NAME')},进行视觉操作")
 
                 # 将图片转换为Base64编码
-                image_base64 = convert_image_to_base64(image_path)
+                image_base64 = await asyncio.to_thread(convert_image_to_base64, image_path)
                 # 构建请求负载
-                payload = _build_evaluation_payload(prompt, model_name, image_base64)
+                payload = _build_evaluation_payload(prompt, model_name, image_base64, json_mode)
             else:
                 logger.info(f"使用云端模型{os.getenv('CLOUD_MODEL_NAME')},进行语言(非视觉)操作")
 
-                payload = _build_evaluation_payload(prompt, model_name, '')
+                payload = _build_evaluation_payload(prompt, model_name, '', json_mode)
 
             headers = {
                 'Content-Type': 'application/json',
                 'Authorization': f'Bearer {api_key}'
             }
-            response = requests.post(api_url, json=payload, headers=headers)
+            if LLM_STREAM:
+                async with async_backend_limit("cloud_llm"):
+                    status_code, content = await _stream_completion(api_url, payload, logger, headers, sse=True)
+                if status_code == 200:
+                    if not content:
+                        logger.warning("API 响应中没有内容")
+                        return "无内容", False
+                    logger.info(f"API 响应: Content={content}")
+                    return content, True
+                logger.warning(f"第 {attempt + 1} 次尝试失败，状态码: {status_code}")
+                continue
+            async with async_backend_limit("cloud_llm"):
+                response = await _get_client().post(api_url, json=payload, headers=headers)
             if response.status_code == 200:
                 try:
                     # 解析 JSON 数据
@@ -156,7 +399,7 @@ def convert_image_to_base64(image_path, quality=80) -> str:
 # model_name = "Qwen/Qwen2.5-VL-32B-Instruct"
 
 
-def _build_evaluation_payload(prompt, model_name, image_base64='', ) -> dict:
+def _build_evaluation_payload(prompt, model_name, image_base64='', json_mode=False) -> dict:
     """构建评估请求负载。
     :type model_name: object
     """
@@ -176,7 +419,7 @@ def _build_evaluation_payload(prompt, model_name, image_base64='', ) -> dict:
             }
         })
 
-    return {
+    payload = {
         "model": f"{model_name}",
         "messages": [
             {
@@ -184,8 +427,11 @@ def _build_evaluation_payload(prompt, model_name, image_base64='', ) -> dict:
                 "content": content
             }
         ],
-        "stream": False
+        "stream": LLM_STREAM
     }
+    if json_mode:
+        payload["response_format"] = {"type": "json_object"}
+    return payload
 
 
 
@@ -0,0 +1,61 @@
+import os
+import asyncio
+import threading
+from urllib.parse import urlparse
+
+__all__ = ["backend_limit", "async_backend_limit", "domain_limit"]
+
+# 各后端默认的最大并发数，可通过环境变量 <名称>_CONCURRENCY 覆盖，如 LOCAL_LLM_CONCURRENCY=1
+DEFAULT_LIMITS = {
+    "local_llm": 2,
+    "cloud_llm": 8,
+    "search": 2,
+    "crawl": 8,
+}
+
+_limits = {}
+_async_limits = {}
+_domain_limits = {}
+_lock = threading.Lock()
+
+
+def backend_limit(name: str) -> threading.BoundedSemaphore:
+    """获取指定后端的并发信号量，多个分析线程共享同一个上限
+
+    参数:
+        name (str): 后端名称，如 local_llm、cloud_llm、search、crawl
+
+    返回:
+        threading.BoundedSemaphore: 用 with 语句包裹对该后端的调用
+    """
+    with _lock:
+        if name not in _limits:
+            _limits[name] = threading.BoundedSemaphore(_limit_value(name))
+        return _limits[name]
+
+
+def _limit_value(name: str) -> int:
+    return max(1, int(os.getenv(f"{name.upper()}_CONCURRENCY", DEFAULT_LIMITS.get(name, 4))))
+
+
+def async_backend_limit(name: str) -> asyncio.Semaphore:
+    """获取指定后端的异步并发信号量，上限与 backend_limit 相同
+
+    信号量绑定在首次使用它的事件循环上，模型请求统一在 call_llm 的后台事件循环中执行
+    """
+    with _lock:
+        if name not in _async_limits:
+            _async_limits[name] = asyncio.Semaphore(_limit_value(name))
+        return _async_limits[name]
+
+
+def domain_limit(url: str) -> threading.BoundedSemaphore:
+    """获取指定网址所属域名的并发信号量，避免同时向同一站点发起过多请求
+
+    上限由环境变量 CRAWL_PER_DOMAIN 配置（默认为2）
+    """
+    domain = urlparse(url).netloc
+    with _lock:
+        if domain not in _domain_limits:
+            _domain_limits[domain] = threading.BoundedSemaphore(max(1, int(os.getenv("CRAWL_PER_DOMAIN", 2))))
+        return _domain_limits[domain]
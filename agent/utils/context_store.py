@@ -0,0 +1,155 @@
+import datetime
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from agent.utils.cache import DiskCache, cache_key
+
+__all__ = ["ContextStore", "context_store", "post_terms", "post_entities", "tfidf_similarity"]
+
+# 同一用户同一周内、至少有一个相同实体的帖子，相似度达到 CONTEXT_REUSE_THRESHOLD 时直接复用背景调查结果，
+# 达到 CONTEXT_EXTEND_THRESHOLD 时以已有搜索结果为起点继续调查
+CONTEXT_REUSE_THRESHOLD = float(os.getenv("CONTEXT_REUSE_THRESHOLD", 0.6))
+CONTEXT_EXTEND_THRESHOLD = float(os.getenv("CONTEXT_EXTEND_THRESHOLD", 0.3))
+# 每个用户每周最多保留的背景调查条数
+CONTEXT_STORE_MAX_ENTRIES = int(os.getenv("CONTEXT_STORE_MAX_ENTRIES", 50))
+
+_LABEL_PATTERN = re.compile(r"帖子\S{0,6}：")
+_URL_PATTERN = re.compile(r"https?://\S+")
+_WORD_PATTERN = re.compile(r"[a-z0-9][a-z0-9'#@]{2,}")
+_CJK_PATTERN = re.compile(r"[一-龥]+")
+_TAG_PATTERN = re.compile(r"[#@][A-Za-z0-9_]{2,}")
+_PHRASE_PATTERN = re.compile(r"[A-Z][a-zA-Z'.-]+(?:\s+[A-Z][a-zA-Z'.-]+)*")
+# 句首常见的大写词、星期与月份不作为实体
+_PHRASE_STOPWORDS = {
+    "a", "an", "and", "but", "or", "so", "the", "this", "that", "these", "those", "it", "its", "i", "we", "you",
+    "he", "she", "they", "our", "my", "your", "his", "her", "their", "thank", "thanks", "folks", "great", "big",
+    "today", "tonight", "yesterday", "tomorrow", "now", "just", "very", "all", "will", "in", "on", "at", "for",
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+    "january", "february", "march", "april", "may", "june", "july", "august", "september", "october",
+    "november", "december",
+}
+# 中文按常见虚词与泛指词切分，余下2~8字的片段视为实体
+_CJK_STOPWORDS = re.compile(
+    "大家|我们|你们|他们|一起|支持|这个|那个|今天|非常|已经|没有|因为|所以|但是|如果|的|了|是|在|和|与|也|都|就|把|被|对|为|将|要|很|让")
+
+
+def post_terms(text: str) -> Counter:
+    """将帖子文本转换为用于相似度比较的词频
+
+    英文按单词（至少3个字符）切分，中文按相邻两字切分；帖子内容的固定标签与链接会被移除
+    """
+    text = _URL_PATTERN.sub(" ", _LABEL_PATTERN.sub(" ", str(text))).lower()
+    terms = Counter(_WORD_PATTERN.findall(text))
+    for run in _CJK_PATTERN.findall(text):
+        terms.update(run[i:i + 2] for i in range(max(1, len(run) - 1)))
+    return terms
+
+
+def post_entities(text: str) -> set:
+    """提取帖子中的实体：话题标签、提及、大写的专有名词短语与中文名词片段，统一转为小写"""
+    text = _URL_PATTERN.sub(" ", _LABEL_PATTERN.sub(" ", str(text)))
+    entities = {tag.lower() for tag in _TAG_PATTERN.findall(text)}
+    for phrase in _PHRASE_PATTERN.findall(text):
+        words = [w for w in phrase.lower().split() if w.strip("'.-") not in _PHRASE_STOPWORDS]
+        if words:
+            entities.add(" ".join(words))
+    for run in _CJK_PATTERN.findall(text):
+        entities.update(part for part in _CJK_STOPWORDS.split(run) if 2 <= len(part) <= 8)
+    return entities
+
+
+def tfidf_similarity(query: Counter, documents: list) -> list:
+    """计算 query 与每个文档的 TF-IDF 余弦相似度
+
+    IDF 以 query 与 documents 为语料计算，同一用户反复出现的套话权重较低，不会主导相似度
+    """
+    corpus = [query] + documents
+    df = Counter(term for terms in corpus for term in terms)
+    idf = {term: math.log((1 + len(corpus)) / (1 + count)) + 1 for term, count in df.items()}
+
+    def vector(terms):
+        return {term: (1 + math.log(count)) * idf[term] for term, count in terms.items()}
+
+    def norm(vec):
+        return math.sqrt(sum(v * v for v in vec.values()))
+
+    q = vector(query)
+    q_norm = norm(q)
+    scores = []
+    for terms in documents:
+        d = vector(terms)
+        d_norm = norm(d)
+        dot = sum(weight * d[term] for term, weight in q.items() if term in d)
+        scores.append(dot / (q_norm * d_norm) if q_norm and d_norm else 0.0)
+    return scores
+
+
+def week_bucket(create_time) -> str:
+    """将发布时间转换为 ISO 周，如 2024-W44；无法解析时返回 None"""
+    match = re.search(r"(\d{4})-(\d{2})-(\d{2})", str(create_time))
+    if not match:
+        return None
+    try:
+        year, week, _ = datetime.date(*map(int, match.groups())).isocalendar()
+    except ValueError:
+        return None
+    return f"{year}-W{week:02d}"
+
+
+class ContextStore:
+    """按 用户 + 发布周 保存背景调查结果，供同一事件的后续帖子复用
+
+    同一分组内只比较与当前帖子至少有一个相同实体的记录，再按 TF-IDF 余弦相似度选出最相似的一条；
+    分组内条目很少，直接精确计算即可
+    """
+
+    def __init__(self, ttl: int = None):
+        self.cache = DiskCache("contexts", ttl=ttl, max_entries=int(os.getenv("CONTEXT_STORE_MAX_BUCKETS", 10000)))
+        self._lock = threading.Lock()
+
+    def _key(self, user_name, create_time):
+        bucket = week_bucket(create_time)
+        return cache_key(user_name, bucket) if bucket else None
+
+    def lookup(self, user_name, create_time, post):
+        """查找最相似的已有背景调查
+
+        返回:
+            tuple: (相似度, 记录)；无可比较的记录时为 (0.0, None)
+                   记录包含 context、context_rounds、seen_links、links_count
+        """
+        key = self._key(user_name, create_time)
+        if key is None:
+            return 0.0, None
+        entities = post_entities(post)
+        # 没有相同实体的帖子讨论的不是同一事件，即使措辞相近也不复用
+        candidates = [entry for entry in self.cache.get(key) or [] if entities & set(entry.get("entities", []))]
+        if not candidates:
+            return 0.0, None
+        scores = tfidf_similarity(post_terms(post), [Counter(entry["terms"]) for entry in candidates])
+        best_score, best_entry = max(zip(scores, candidates), key=lambda item: item[0])
+        return best_score, best_entry
+
+    def add(self, user_name, create_time, post, context, context_rounds=None, seen_links=None, links_count=0):
+        """保存一条背景调查结果"""
+        key = self._key(user_name, create_time)
+        if key is None:
+            return
+        entry = {
+            "terms": dict(post_terms(post)),
+            "entities": sorted(post_entities(post)),
+            "context": context,
+            "context_rounds": context_rounds or [],
+            "seen_links": sorted(seen_links or []),
+            "links_count": links_count,
+        }
+        with self._lock:
+            entries = self.cache.get(key) or []
+            entries.append(entry)
+            self.cache.set(key, entries[-CONTEXT_STORE_MAX_ENTRIES:])
+
+
+context_store = ContextStore(ttl=int(os.getenv("CONTEXT_STORE_TTL", 30 * 24 * 3600)))
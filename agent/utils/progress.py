@@ -0,0 +1,52 @@
+import json
+import os
+import threading
+import time
+
+__all__ = ["ProgressLedger"]
+
+
+class ProgressLedger:
+    """持久化的处理进度记录，用于中断后续跑时跳过已完成的帖子
+
+    - 每条完成记录追加为 JSONL 文件中的一行，写入后立即 fsync
+    - 以来源链接等唯一标识作为键，重复标记同一键不会重复写入
+    - 文件末尾不完整的行（写入时进程崩溃）会被忽略
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._done = set()
+        self._needs_newline = False
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+            self._needs_newline = bool(content) and not content.endswith("\n")
+            for line in content.splitlines():
+                try:
+                    self._done.add(json.loads(line)["key"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def is_done(self, key: str) -> bool:
+        return key in self._done
+
+    def mark_done(self, key: str, **info) -> None:
+        """记录一条已完成的帖子，info 中的字段一并写入便于排查"""
+        with self._lock:
+            if key in self._done:
+                return
+            record = {"key": key, "finished_at": time.strftime("%Y-%m-%d %H:%M:%S"), **info}
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                if self._needs_newline:
+                    f.write("\n")
+                    self._needs_newline = False
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._done.add(key)
@@ -0,0 +1,33 @@
+import threading
+import time
+
+__all__ = ["TokenBucket"]
+
+
+class TokenBucket:
+    """线程安全的令牌桶限流器
+
+    以 rate 个/秒的速度补充令牌，最多积攒 capacity 个；
+    令牌充足时立即放行，只有超出配额时才等待。
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """获取一个令牌，返回实际等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
@@ -0,0 +1,111 @@
+import json
+import os
+import re
+import threading
+
+import yaml
+
+from agent.utils.call_llm import call_llm
+from agent.utils.trace import annotate
+
+__all__ = ["JSON_MODE", "parse_structured", "structured_call", "parse_stats"]
+
+# 支持时使用后端的 JSON 输出模式（Ollama format=json，OpenAI 兼容接口 response_format）
+JSON_MODE = os.getenv("LLM_JSON_MODE", "1") != "0"
+# 响应无法解析时，同一提示词最多重新请求的次数
+LLM_PARSE_RETRIES = int(os.getenv("LLM_PARSE_RETRIES", 1))
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record(name, outcome):
+    with _stats_lock:
+        counter = _stats.setdefault(name, {"ok": 0, "repaired": 0, "failed": 0})
+        counter[outcome] += 1
+
+
+def parse_stats() -> dict:
+    """各调用方的解析结果统计：直接解析成功、修复后成功、失败的次数"""
+    with _stats_lock:
+        return {name: dict(counter) for name, counter in _stats.items()}
+
+
+def _load(text):
+    text = text.strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        return yaml.safe_load(text)
+
+
+def parse_structured(response, name, logger, repair=None):
+    """解析模型返回的结构化结果
+
+    依次尝试：整段 JSON、```json / ```yaml 代码块、由 repair 修复后的代码块
+
+    参数:
+        response (str): 模型响应
+        name (str): 调用方名称，用于统计
+        logger: 日志记录器
+        repair (Callable[[str], str]): 可选，修复代码块文本的函数
+
+    返回:
+        dict: 解析结果；无法解析为字典时返回 None
+    """
+    if not response:
+        _record(name, "failed")
+        return None
+    block = response
+    match = re.search(r"```(?:json|yaml)\s*\n?(.*?)(?:```|$)", response, re.S)
+    if match:
+        block = match.group(1)
+    try:
+        data = _load(block)
+        if isinstance(data, dict):
+            _record(name, "ok")
+            return data
+    except Exception:
+        pass
+    if repair is not None:
+        try:
+            data = yaml.safe_load(repair(block))
+            if isinstance(data, dict):
+                _record(name, "repaired")
+                return data
+        except Exception:
+            pass
+    _record(name, "failed")
+    logger.error(f"[{name}] LLM 响应格式不正确: {response[:200]}")
+    return None
+
+
+def structured_call(prompt, name, logger, repair=None, retries=None):
+    """调用模型并解析结构化结果，解析失败时在重试次数内重新请求
+
+    无法解析的响应不会写入 LLM 缓存，重试时会重新请求模型
+
+    返回:
+        dict: 解析结果；请求失败或重试用尽时返回 None
+    """
+    retries = LLM_PARSE_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        parsed = {}
+
+        def validate(response):
+            parsed["data"] = parse_structured(response, name, logger, repair)
+            return parsed["data"] is not None
+
+        response, success = call_llm(prompt, logger, json_mode=JSON_MODE, validate=validate)
+        if not success:
+            logger.error(f"[{name}] LLM 响应失败")
+            return None
+        if "data" not in parsed:
+            # 命中缓存时不会调用 validate
+            parsed["data"] = parse_structured(response, name, logger, repair)
+        if parsed["data"] is not None:
+            return parsed["data"]
+        if attempt < retries:
+            annotate(retries=1)
+            logger.warning(f"[{name}] 第 {attempt + 1} 次响应无法解析，重新请求")
+    return None
@@ -0,0 +1,157 @@
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+__all__ = ["span", "annotate", "traced", "traced_node", "post_trace", "bind", "trace_summary"]
+
+# 记录每个节点、模型调用、搜索与抓取的耗时，写入 logs/trace_<时间>.jsonl，TRACE=0 关闭
+TRACE_ENABLED = os.getenv("TRACE", "1") != "0"
+TRACE_DIR = os.getenv("TRACE_DIR", "./logs")
+
+_post = contextvars.ContextVar("trace_post", default=None)
+_span = contextvars.ContextVar("trace_span", default=None)
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_file = None
+_trace_path = None
+_summary = {}
+_posts = {}
+
+
+def _write(record):
+    global _file, _trace_path
+    stats_key = record["name"]
+    with _lock:
+        stats = _summary.setdefault(stats_key, {
+            "calls": 0, "total_s": 0.0, "max_s": 0.0, "errors": 0, "cache_hits": 0,
+            "prompt_chars": 0, "response_chars": 0, "retries": 0, "actions": {},
+        })
+        stats["calls"] += 1
+        stats["total_s"] += record["duration"]
+        stats["max_s"] = max(stats["max_s"], record["duration"])
+        stats["errors"] += record["status"] != "ok"
+        stats["cache_hits"] += record.get("cache_hit") is True
+        stats["prompt_chars"] += record.get("prompt_chars", 0)
+        stats["response_chars"] += record.get("response_chars", 0)
+        stats["retries"] += record.get("retries", 0)
+        if record.get("action") is not None:
+            stats["actions"][record["action"]] = stats["actions"].get(record["action"], 0) + 1
+        if stats_key == "post":
+            _posts[record["post"]] = record["duration"]
+
+        if _file is None:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            _trace_path = os.path.join(TRACE_DIR, f"trace_{time.strftime('%Y%m%d_%H%M%S')}.jsonl")
+            _file = open(_trace_path, "a", encoding="utf-8", buffering=1)
+        _file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+@contextmanager
+def span(name, **attrs):
+    """记录一段操作的耗时，嵌套的 span 通过 parent 关联
+
+    返回的字典可在操作过程中补充字段，如 cache_hit、response_chars
+    """
+    if not TRACE_ENABLED:
+        yield {}
+        return
+    parent = _span.get()
+    record = {
+        "name": name,
+        "id": next(_ids),
+        "parent": parent["id"] if parent else None,
+        "post": _post.get(),
+        "thread": threading.current_thread().name,
+        **attrs,
+    }
+    token = _span.set(record)
+    record["start"] = time.time()
+    started = time.perf_counter()
+    record["status"] = "ok"
+    try:
+        yield record
+    except BaseException as e:
+        record["status"] = "error"
+        record["error"] = repr(e)[:200]
+        raise
+    finally:
+        _span.reset(token)
+        record["duration"] = round(time.perf_counter() - started, 4)
+        _write(record)
+
+
+def annotate(**attrs):
+    """为当前 span 补充字段；数值型的 retries 会累加"""
+    record = _span.get()
+    if record is None:
+        return
+    for key, value in attrs.items():
+        if key == "retries":
+            record[key] = record.get(key, 0) + value
+        else:
+            record[key] = value
+
+
+def traced(name):
+    """函数装饰器：每次调用记录为一个 span"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def traced_node(cls):
+    """pocketflow 节点的类装饰器：记录每次运行（prep/exec/post）的耗时与返回的 action"""
+    run = cls._run
+
+    @functools.wraps(run)
+    def _run(self, shared):
+        with span(cls.__name__) as record:
+            action = run(self, shared)
+            record["action"] = action
+            return action
+
+    cls._run = _run
+    return cls
+
+
+@contextmanager
+def post_trace(key):
+    """将一条帖子的全部 span 归到同一个 post 下"""
+    token = _post.set(key)
+    try:
+        with span("post"):
+            yield
+    finally:
+        _post.reset(token)
+
+
+def bind(func):
+    """复制当前上下文，使提交到线程池的任务仍归属于当前帖子与 span"""
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+def trace_summary(top=5) -> dict:
+    """按操作名汇总调用次数与耗时，并列出耗时最长的帖子"""
+    with _lock:
+        operations = {}
+        for name, stats in sorted(_summary.items(), key=lambda item: -item[1]["total_s"]):
+            summary = {
+                **stats,
+                "total_s": round(stats["total_s"], 3),
+                "avg_s": round(stats["total_s"] / stats["calls"], 3) if stats["calls"] else 0.0,
+                "max_s": round(stats["max_s"], 3),
+                "actions": dict(stats["actions"]),
+            }
+            # 省略为0的计数，便于阅读
+            operations[name] = {key: value for key, value in summary.items() if value or key == "calls"}
+        slowest = sorted(_posts.items(), key=lambda item: -item[1])[:top]
+        return {"trace_file": _trace_path, "operations": operations, "slowest_posts": slowest}
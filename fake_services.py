@@ -0,0 +1,336 @@
+"""离线测试用的本地模拟服务
+
+- 模拟大模型：Ollama (/api/generate) 与 OpenAI 兼容接口 (/v1/chat/completions)，
+  按提示词关键字返回预设的 YAML/JSON 结果，支持流式输出、首个 token 延迟与生成速度配置
+- 模拟搜索：serper.dev 兼容的 /search 接口
+- 静态网页：/pages/<名称>，供爬虫抓取
+- 测试数据：生成 twitter_process 使用的 social_data.csv 与 video_sct.csv
+
+用法:
+    python fake_services.py serve [--port 8900] [--latency 0.5] [--tokens-per-sec 50]
+    python fake_services.py dataset <输出目录> [--rows 100]
+    python fake_services.py bench [--rows 100] [--mode full|fast] [--latency 0.5]
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import yaml
+
+# 帖子结束后模型常见的多余解释，用于验证流式输出的提前结束
+TRAILING_TEXT = "\n以上是根据帖子内容给出的分析结果，" + "如需进一步说明请告知。" * 20
+
+EVENTS = [
+    ("Pennsylvania rally", "宾夕法尼亚集会"),
+    ("early voting", "提前投票"),
+    ("border security", "边境安全"),
+    ("inflation report", "通胀报告"),
+    ("debate night", "电视辩论"),
+    ("supreme court ruling", "最高法院裁决"),
+    ("tariff plan", "关税计划"),
+    ("hurricane relief", "飓风救灾"),
+]
+
+SENTIMENTS = ["positive", "negative", "neutral", "mixed"]
+STYLES = ["formal", "informal", "aggressive", "inspirational"]
+
+
+def _stable_choice(options, text):
+    digest = hashlib.md5(text.encode("utf-8")).digest()
+    return options[digest[0] % len(options)]
+
+
+def _post_keywords(prompt, limit=3):
+    """从提示词中的帖子内容提取关键词，作为搜索查询与话题"""
+    match = re.search(r"帖子文本内容：\s*(.*?)(?:\n\s*\n|帖子视听文本数据：|$)", prompt, re.S)
+    text = match.group(1) if match else prompt
+    words = []
+    for word in re.findall(r"[A-Za-z][A-Za-z']{3,}|[一-龥]{2,4}", text):
+        if word.lower() not in {w.lower() for w in words}:
+            words.append(word)
+    return words[:limit] or ["news"]
+
+
+def _format(obj, json_mode, fence="yaml"):
+    if json_mode:
+        return json.dumps(obj, ensure_ascii=False)
+    if fence == "json":
+        body = json.dumps(obj, ensure_ascii=False, indent=1)
+    else:
+        body = yaml.safe_dump(obj, allow_unicode=True, default_flow_style=None, sort_keys=False)
+    return f"```{fence}\n{body}```" + TRAILING_TEXT
+
+
+def _evaluation(prompt):
+    keywords = _post_keywords(prompt)
+    return {
+        "topics": keywords,
+        "sentiment": _stable_choice(SENTIMENTS, prompt),
+        "style": _stable_choice(STYLES, prompt[::-1]),
+        "related_events": [" ".join(keywords[:2])],
+    }
+
+
+def fake_completion(prompt, json_mode=False):
+    """根据提示词关键字生成模拟的模型响应"""
+    if "### 帖子 p" in prompt:
+        # 批量评估
+        items = re.split(r"### 帖子 (p\d+)", prompt)[1:]
+        results = {post_id: _evaluation(body) for post_id, body in zip(items[::2], items[1::2])}
+        return _format(results, json_mode, fence="json")
+    if "请分析以下网页内容" in prompt:
+        title = re.search(r"标题: (.*)", prompt)
+        title = title.group(1).strip() if title else "网页"
+        return _format({"summary": f"{title}的相关报道，介绍了事件经过与各方反应。",
+                        "topics": _post_keywords(prompt), "content_type": "新闻文章"}, json_mode)
+    if "evaluate 或 search" in prompt or "evaluate OR search" in prompt:
+        # 快速模式：首次可搜索时搜索一次，之后给出评估
+        if "可以进行一次网络搜索" in prompt and "搜索条件" not in prompt:
+            return _format({"action": "search", "search_queries": [" ".join(_post_keywords(prompt, 2))]}, json_mode)
+        return _format({"action": "evaluate", "search_queries": [], **_evaluation(prompt)}, json_mode)
+    if "操作空间" in prompt and "先前的研究" in prompt:
+        # 背景调查决策：没有先前研究时搜索，否则回答
+        count = re.search(r"先前的研究,总计为(\d+)条", prompt)
+        if count and int(count.group(1)) == 0:
+            keywords = _post_keywords(prompt)
+            return _format({"thinking": "需要了解帖子提到的事件", "action": "search", "reason": "缺少背景信息",
+                            "search_queries": [" ".join(keywords[:2]), f"{keywords[0]} 最新进展"]}, json_mode)
+        return _format({"thinking": "已有足够的背景信息", "action": "answer", "reason": "研究已覆盖主要查询条件",
+                        "answer": f"帖子涉及{'、'.join(_post_keywords(prompt))}，相关事件近期受到广泛关注。"},
+                       json_mode)
+    return _format(_evaluation(prompt), json_mode)
+
+
+def page_html(slug):
+    title = slug.replace("-", " ").title()
+    paragraphs = "".join(
+        f"<p>{title} 第{i + 1}段：报道介绍了事件的起因、关键节点与各方回应，并引用了公众评论。</p>" for i in range(8))
+    return (f"<html><head><title>{title}</title></head><body><nav>导航</nav>"
+            f"<article><h1>{title}</h1>{paragraphs}</article><footer>版权信息</footer></body></html>")
+
+
+class FakeServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 由 make_server 设置
+    latency = 0.5
+    tokens_per_sec = 50.0
+    stats = None
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _count(self, key):
+        with self.stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def _send(self, status, body, content_type="application/json"):
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, pieces, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for piece in pieces:
+                data = piece.encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端读到完整的代码块后主动断开
+            self._count("stream_cancelled")
+            self.close_connection = True
+
+    def _tokens(self, text):
+        # 按约4个字符切分为 token，并按配置的速度输出
+        time.sleep(self.latency)
+        delay = 1 / self.tokens_per_sec if self.tokens_per_sec > 0 else 0
+        for i in range(0, len(text), 4):
+            if delay:
+                time.sleep(delay)
+            yield text[i:i + 4]
+
+    def do_GET(self):
+        if self.path.startswith("/pages/"):
+            self._count("pages")
+            self._send(200, page_html(self.path[len("/pages/"):].strip("/")), "text/html; charset=utf-8")
+        elif self.path == "/stats":
+            with self.stats_lock:
+                self._send(200, json.dumps(self.stats))
+        else:
+            self._send(404, "{}")
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.startswith("/api/generate"):
+            self._count("ollama")
+            text = fake_completion(body.get("prompt", ""), body.get("format") == "json")
+            if body.get("stream"):
+                pieces = (json.dumps({"response": token, "done": False}, ensure_ascii=False) + "\n"
+                          for token in self._tokens(text))
+                self._stream(_chain(pieces, [json.dumps({"response": "", "done": True}) + "\n"]),
+                             "application/x-ndjson")
+            else:
+                text = "".join(self._tokens(text))
+                self._send(200, json.dumps({"response": text, "done": True}, ensure_ascii=False))
+        elif self.path.startswith("/v1/chat/completions"):
+            self._count("openai")
+            content = body.get("messages", [{}])[0].get("content", "")
+            if isinstance(content, list):
+                content = "".join(part.get("text", "") for part in content if part.get("type") == "text")
+            json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+            text = fake_completion(content, json_mode)
+            if body.get("stream"):
+                pieces = ("data: " + json.dumps({"choices": [{"delta": {"content": token}}]}, ensure_ascii=False)
+                          + "\n\n" for token in self._tokens(text))
+                self._stream(_chain(pieces, ["data: [DONE]\n\n"]), "text/event-stream")
+            else:
+                text = "".join(self._tokens(text))
+                self._send(200, json.dumps({"choices": [{"message": {"content": text}}]}, ensure_ascii=False))
+        elif self.path.startswith("/search"):
+            self._count("search")
+            query = str(body.get("q", ""))
+            host = self.headers.get("Host", f"127.0.0.1:{self.server.server_port}")
+            slug = re.sub(r"[^a-z0-9]+", "-", query.lower()).strip("-") or hashlib.md5(query.encode()).hexdigest()[:8]
+            organic = [{
+                "title": f"{query} 相关报道 {i + 1}",
+                "link": f"http://{host}/pages/{slug}-{i + 1}",
+                "snippet": f"关于 {query} 的最新报道与评论。",
+            } for i in range(int(body.get("num", 3)))]
+            self._send(200, json.dumps({"organic": organic}, ensure_ascii=False))
+        else:
+            self._send(404, "{}")
+
+
+def _chain(*iterables):
+    for iterable in iterables:
+        yield from iterable
+
+
+def make_server(port=8900, latency=0.5, tokens_per_sec=50.0):
+    handler = type("Handler", (FakeServiceHandler,), {
+        "latency": latency, "tokens_per_sec": tokens_per_sec, "stats": {},
+    })
+    return ThreadingHTTPServer(("127.0.0.1", port), handler)
+
+
+def service_env(port):
+    """指向本地模拟服务的环境变量"""
+    base = f"http://127.0.0.1:{port}"
+    return {
+        "LOCAL_LLM_URL": f"{base}/api/generate",
+        "LOCAL_MODEL_NAME": "gemma3",
+        "CLOUD_MODEL_NAME": "",
+        "CLOUD_API_URL": f"{base}/v1/chat/completions",
+        "SERPAPI_API_KEY": "fake",
+        "SERPER_API_URL": f"{base}/search",
+        "SEARCH_RATE_PER_SEC": "0",
+        "PROXY_URL": "",
+    }
+
+
+def generate_dataset(out_dir, rows=100, seed=0, duplicate_ratio=0.2, low_info_ratio=0.1):
+    """生成 twitter_process 使用的测试数据，包含一定比例的重复帖子与低信息量帖子"""
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    social_rows, video_rows = [], []
+    for i in range(rows):
+        day = 1 + i * 28 // max(rows, 1)
+        file_name = f"2024-10-{day:02d} {rng.randint(0, 23):02d}-{rng.randint(0, 59):02d}-img_{i}.jpg"
+        roll = rng.random()
+        if social_rows and roll < duplicate_ratio:
+            # 转推或重复发布：内容相同，文件名与链接不同
+            source = rng.randrange(len(social_rows))
+            text, transcript = social_rows[source][2], video_rows[source][1]
+        elif roll < duplicate_ratio + low_info_ratio:
+            text, transcript = "🔥🔥 https://t.co/" + str(i), "👍"
+        else:
+            event, event_zh = rng.choice(EVENTS)
+            text = f"Thank you {event.title()}! We will win big on {rng.choice(['Tuesday', 'November 5'])}. #{event.split()[0]}"
+            transcript = f"Folks, the {event} was incredible. {event_zh}，大家一起支持我们。" * rng.randint(1, 3)
+        social_rows.append(["Donald J. Trump", file_name, text, rng.randint(0, 90000),
+                            rng.randint(0, 20000), rng.randint(0, 9000), f"https://x.com/realDonaldTrump/status/{10 ** 17 + i}"])
+        video_rows.append([file_name, transcript])
+
+    with open(os.path.join(out_dir, "social_data.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Display Name", "Saved Filename", "Tweet Content", "Favorite Count", "Retweet Count",
+                         "Reply Count", "Tweet URL"])
+        writer.writerows(social_rows)
+    with open(os.path.join(out_dir, "video_sct.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["file_name", "Contents"])
+        writer.writerows(video_rows)
+    return out_dir
+
+
+def bench(rows, mode, port, latency, tokens_per_sec):
+    """启动模拟服务，生成测试数据，并在全新的缓存目录下完整运行一次 twitter_process"""
+    server = make_server(port, latency, tokens_per_sec)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    generate_dataset(work_dir, rows)
+    # 需在导入 agent 之前设置，agent 的配置在导入时读取
+    os.environ.update(service_env(server.server_port))
+    os.environ.update({"TWITTER_DATA_DIR": work_dir, "CACHE_DIR": os.path.join(work_dir, "cache")})
+    from twitter_process import twitter_process
+
+    started = time.perf_counter()
+    twitter_process(mode)
+    elapsed = time.perf_counter() - started
+    print(f"\n共 {rows} 行，耗时 {elapsed:.1f} 秒，{rows / elapsed:.2f} 行/秒")
+    print(f"模拟服务请求统计: {server.RequestHandlerClass.stats}")
+    print(f"测试数据与结果目录: {work_dir}")
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线测试用的本地模拟服务")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("serve", "bench"):
+        p = sub.add_parser(name)
+        p.add_argument("--port", type=int, default=8900 if name == "serve" else 0)
+        p.add_argument("--latency", type=float, default=0.5, help="首个 token 的延迟（秒）")
+        p.add_argument("--tokens-per-sec", type=float, default=50.0, help="生成速度，0 为不限速")
+        if name == "bench":
+            p.add_argument("--rows", type=int, default=100)
+            p.add_argument("--mode", choices=["full", "fast"], default="full")
+    p = sub.add_parser("dataset")
+    p.add_argument("out_dir")
+    p.add_argument("--rows", type=int, default=100)
+    p.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "dataset":
+        print(f"测试数据已生成: {generate_dataset(args.out_dir, args.rows, args.seed)}")
+    elif args.command == "bench":
+        bench(args.rows, args.mode, args.port, args.latency, args.tokens_per_sec)
+    else:
+        server = make_server(args.port, args.latency, args.tokens_per_sec)
+        print("模拟服务已启动，使用以下环境变量运行 twitter_process.py（可配合 TWITTER_DATA_DIR 指定测试数据）：")
+        for key, value in service_env(server.server_port).items():
+            print(f"{key}={value}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+from agent.utils.cache import DiskCache
+from agent.utils.context_store import ContextStore, CONTEXT_REUSE_THRESHOLD, post_entities
+
+USER = "Donald J. Trump"
+CREATE_TIME = "2024-10-01 12:00:00"
+TEMPLATE = ("帖子文本内容：\nThank you {event}! We will win big on Tuesday. #{tag}\n\n"
+            "帖子视听文本数据：\nFolks, the {lower} was incredible. {zh}，大家一起支持我们。")
+
+
+def _post(event, zh):
+    return TEMPLATE.format(event=event, tag=event.split()[0], lower=event.lower(), zh=zh)
+
+
+def _store(tmp_path):
+    store = ContextStore()
+    store.cache = DiskCache("contexts", path=str(tmp_path / "cache.sqlite3"))
+    return store
+
+
+def test_post_entities():
+    entities = post_entities(_post("Inflation Report", "通胀报告"))
+    assert {"#inflation", "inflation report", "通胀报告"} <= entities
+    assert "thank" not in entities and "tuesday" not in entities
+
+
+def test_different_events_same_week_do_not_reuse(tmp_path):
+    store = _store(tmp_path)
+    store.add(USER, CREATE_TIME, _post("Inflation Report", "通胀报告"), "通胀报告的背景")
+    score, entry = store.lookup(USER, "2024-10-03 09:00:00", _post("Early Voting", "提前投票"))
+    assert entry is None and score == 0.0
+
+
+def test_same_event_reuses(tmp_path):
+    store = _store(tmp_path)
+    post = _post("Inflation Report", "通胀报告")
+    store.add(USER, CREATE_TIME, post, "通胀报告的背景")
+    score, entry = store.lookup(USER, "2024-10-03 09:00:00", post + " Amazing!")
+    assert entry["context"] == "通胀报告的背景"
+    assert score >= CONTEXT_REUSE_THRESHOLD
+
+
+def test_other_week_or_user_not_matched(tmp_path):
+    store = _store(tmp_path)
+    post = _post("Inflation Report", "通胀报告")
+    store.add(USER, CREATE_TIME, post, "通胀报告的背景")
+    assert store.lookup(USER, "2024-10-20 09:00:00", post) == (0.0, None)
+    assert store.lookup("someone else", CREATE_TIME, post) == (0.0, None)
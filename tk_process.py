@@ -5,9 +5,16 @@ import re
 import chardet
 import pandas as pd
 import os
+import sys
 # 导入 agent 和 logger
-from agent.main import social_assessor_assistant, extract_time_from_filename
+from agent.batch import analyze_posts
+from agent.nodes import SupervisorNode
 from agent.log_config import get_logger
+from agent.utils.cache import cache_stats
+from agent.utils.call_llm import stream_stats
+from agent.utils.progress import ProgressLedger
+from agent.utils.structured import parse_stats
+from agent.utils.trace import trace_summary
 
 
 def build_input_content(text_content: str, tk_topic, video_content: str = None) -> str:
@@ -49,7 +56,18 @@ def read_csv_with_encoding(file_path, usecols=None):
     return None
 
 
-def tk_process():
+def progress_key(row, index) -> str:
+    """进度记录的键：优先使用作品链接，缺失时依次使用作品ID与行号，避免缺少链接的行共用同一个键"""
+    for column in ("来源链接", "作品ID"):
+        value = row.get(column)
+        if pd.notna(value) and str(value).strip() not in ("", "nan"):
+            return f"{column}:{value}" if column != "来源链接" else str(value)
+    return f"行号:{index}"
+
+
+def tk_process(mode=None):
+    # 分析模式：full 或 fast，默认读取环境变量 ANALYSIS_MODE；快速模式的结果写入单独的文件
+    mode = mode or os.getenv("ANALYSIS_MODE", "full")
     task_date = datetime.datetime.now().strftime("%Y年%m月%d日%H时%M分")
     task_log_file_path = os.path.join(f"task_{task_date}.log")
     logger = get_logger(__name__, f"{task_log_file_path}")
@@ -60,7 +78,10 @@ def tk_process():
     social_data_path = os.path.join(base_path, "social_data", "tk", "Trump quotes", "social_data.xlsx")
     video_sct_path = os.path.join(base_path, "social_data", "tk", "Trump quotes", "video_sct.csv")
     # 保存更新后的 CSV
-    output_path = os.path.join(base_path, "social_data", "tk", "Trump quotes", "tk_social_data_enhanced.csv")
+    output_name = "tk_social_data_enhanced.csv" if mode == "full" else f"tk_social_data_enhanced_{mode}.csv"
+    output_path = os.path.join(base_path, "social_data", "tk", "Trump quotes", output_name)
+    # 已写入结果的帖子记录在进度文件中，重新运行时跳过
+    ledger = ProgressLedger(os.path.splitext(output_path)[0] + "_progress.jsonl")
 
     def extract_video_id(input: str) -> str:
         match = re.match(r'^(\d+)', input)
@@ -124,10 +145,15 @@ def tk_process():
     merged_df['情感倾向'] = ''
     merged_df['表达风格'] = ''
     merged_df['相关事件'] = ''
-    merged_df.drop(columns=["作品ID"], inplace=True)
 
-    # 循环处理每一行
+    # 构建每一行的分析任务
+    tasks = []
+    skipped = 0
     for index, row in merged_df.iterrows():
+        key = progress_key(row, index)
+        if ledger.is_done(key):
+            skipped += 1
+            continue
         user_name = row["社媒人名称"]
         tk_content = row["社媒文本内容"]
 
@@ -137,14 +163,16 @@ def tk_process():
 
         input_content = build_input_content(tk_content, video_content)
 
-        logger.info(f"正在分析用户 [{user_name}] 的帖子，时间：{create_time}")
-
-        # 调用 agent 函数
+        tasks.append({"index": index, "key": key, "user_name": user_name, "create_time": create_time,
+                      "input_content": input_content})
+    if skipped:
+        logger.info(f"根据进度记录跳过已完成的 {skipped} 行，剩余 {len(tasks)} 行待分析。")
+    merged_df.drop(columns=["作品ID"], inplace=True)
 
-        # result = social_assessor_assistant(user_name, create_time, input_content, logger,
-        #                                    social_data_path=social_data_path, columns_key="作品ID",
-        #                                    columns_vlue=post_id, context="不搜索到此内容的相关背景")
-        result, context = social_assessor_assistant(user_name, create_time, input_content, logger)
+    # 并发调用 agent 函数，结果按行顺序返回
+    for task, (result, context) in analyze_posts(tasks, logger, mode=mode):
+        index = task["index"]
+        user_name = task["user_name"]
 
         try:
             # 假设返回的是 JSON 格式字符串或字典
@@ -153,6 +181,11 @@ def tk_process():
             else:
                 result_dict = result
 
+            # 未通过完整性检查的结果不写入也不记录进度，下次运行时重新分析
+            if not SupervisorNode.is_complete(result_dict):
+                logger.warning(f"[分析未完成] 用户 [{user_name}] 第 {index} 行结果不完整，留待下次运行: {result_dict}")
+                continue
+
             # 写入 DataFrame
             merged_df.at[index, '主题'] = ", ".join(result_dict.get('topics', []))
             merged_df.at[index, '情感倾向'] = result_dict.get('sentiment', '')
@@ -164,7 +197,7 @@ def tk_process():
 
             # 以追加模式写入当前行
             # 构造当前行的 DataFrame
-            current_row_df = merged_df.iloc[[index]]
+            current_row_df = merged_df.loc[[index]]
 
             write_header = False  # 后续不再写入表头
             if index == 0:
@@ -177,6 +210,7 @@ def tk_process():
                 encoding="utf-8-sig"
             )
 
+            ledger.mark_done(task["key"], index=int(index))
             logger.info(f"当前进度已保存至 {output_path}")
 
         except Exception as e:
@@ -186,7 +220,12 @@ def tk_process():
     #
     # merged_df.to_csv(output_path, index=False, encoding="utf-8-sig")
     logger.info(f"所有数据处理完成，结果已保存至 {output_path}")
+    logger.info(f"缓存命中统计: {cache_stats()}")
+    logger.info(f"模型流式响应统计: {stream_stats()}")
+    logger.info(f"模型响应解析统计: {parse_stats()}")
+    logger.info(f"耗时统计: {trace_summary()}")
 
 
 if __name__ == "__main__":
-    tk_process()
+    # python tk_process.py [--fast]
+    tk_process("fast" if "--fast" in sys.argv else None)
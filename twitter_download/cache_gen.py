@@ -19,6 +19,9 @@ class cache_gen():
     def add(self, element):
         self.cache_data.add(element)
 
+    def discard(self, element):
+        self.cache_data.discard(element)
+
     def is_present(self, element):
         if element in self.cache_data:
             return False
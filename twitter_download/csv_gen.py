@@ -5,7 +5,8 @@ from datetime import datetime
 class csv_gen():
     def __init__(self, save_path:str, user_name, screen_name, tweet_range) -> None:
         print(save_path)
-        self.f = open(f'{save_path}/social_data_{datetime.now().strftime("%Y年%m月%d日%H时%M分%S秒")}.csv', 'w', encoding='utf-8-sig', newline='')
+        self.path = f'{save_path}/social_data_{datetime.now().strftime("%Y年%m月%d日%H时%M分%S秒")}.csv'
+        self.f = open(self.path, 'w', encoding='utf-8-sig', newline='')
         self.writer = csv.writer(self.f)
 
         #初始化
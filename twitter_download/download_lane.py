@@ -0,0 +1,19 @@
+import asyncio
+import time
+
+class download_lane():
+    # 下载通道: 图片与视频各自拥有独立的并发数与带宽, 避免大视频占满所有下载位
+
+    def __init__(self, max_concurrent, bandwidth=0) -> None:
+        self.semaphore = asyncio.Semaphore(max(1, max_concurrent))
+        self.bandwidth = bandwidth     # 字节/秒, 0为不限制
+        self.next_time = 0
+
+    async def consume(self, size):
+        # 按带宽上限为已读取的数据计时, 超速时等待
+        if not self.bandwidth:
+            return
+        now = time.monotonic()
+        self.next_time = max(self.next_time, now) + size / self.bandwidth
+        if self.next_time > now:
+            await asyncio.sleep(self.next_time - now)
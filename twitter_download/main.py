@@ -6,12 +6,16 @@ import asyncio
 import os
 import json
 import sys
+import hashlib
 
 sys.path.append('.')
 from user_info import User_info
 from csv_gen import csv_gen
 from md_gen import md_gen
 from cache_gen import cache_gen
+from queue_gen import queue_gen
+from download_lane import download_lane
+from manifest_gen import manifest_gen
 from url_utils import quote_url
 
 # 创建 logs 文件夹
@@ -79,6 +83,21 @@ md_file = None
 md_output = True
 media_count_limit = 0
 
+metadata_only = False  # 仅抓取元数据(CSV/Markdown)，不下载图片/视频
+media_queue = False  # 仅元数据模式下，将媒体记录到 media_queue.jsonl 供之后批量下载
+parquet_output = False  # 额外导出 Parquet 文件(需安装 pandas 与 pyarrow)
+queue_data = None
+use_manifest = True  # 记录已下载文件的大小/ETag/校验值，重复运行时只下载有变化的文件
+manifest_data = None
+
+video_policy = 'max_bitrate'  # 视频清晰度选择策略: max_bitrate / min_bitrate / bitrate_cap / resolution
+video_bitrate_cap = 0  # bitrate_cap 策略下的最大码率(bps)
+video_target_height = 0  # resolution 策略下的目标分辨率(短边像素，如 480)
+video_byte_budget = 0  # 单次运行的视频下载量上限(MB)，0为不限制
+video_bytes_started = 0  # 本次运行已开始下载的视频大小(字节)
+video_bytes_charged = set()  # 已计入下载量的视频地址，重试时不重复计入
+video_size_estimates = {}  # 视频地址 -> 按时长与码率估算的大小(字节)，服务器未返回 Content-Length 时使用
+
 start_time_stamp = 655028357000  # 1990-10-04
 end_time_stamp = 2548484357000  # 2050-10-04
 start_label = True
@@ -117,6 +136,11 @@ with open(os.path.join(current_dir, 'settings.json'), 'r', encoding='utf8') as f
         max_concurrent_requests = settings['max_concurrent_requests']
     else:
         max_concurrent_requests = 8
+    # 图片与视频分通道下载，视频通道默认只占最大并发数的 1/4
+    image_concurrent_requests = settings.get('image_concurrent_requests') or max_concurrent_requests
+    video_concurrent_requests = settings.get('video_concurrent_requests') or max(1, max_concurrent_requests // 4)
+    bandwidth_limit = (settings.get('bandwidth_limit') or 0) * 1024  # 总带宽上限(KB/s)，0为不限制
+    video_bandwidth_share = settings.get('video_bandwidth_share') or 0.5  # 视频通道所占带宽比例
     ###### proxy ######
     if settings['proxy']:
         proxies = settings['proxy']
@@ -137,6 +161,24 @@ with open(os.path.join(current_dir, 'settings.json'), 'r', encoding='utf8') as f
     if settings['media_count_limit']:
         media_count_limit = settings['media_count_limit']
 
+    if settings.get('metadata_only'):
+        metadata_only = True
+    if settings.get('media_queue'):
+        media_queue = True
+    if settings.get('parquet_output'):
+        parquet_output = True
+    if settings.get('manifest') is False:
+        use_manifest = False
+
+    if settings.get('video_policy'):
+        video_policy = settings['video_policy']
+    if settings.get('video_bitrate_cap'):
+        video_bitrate_cap = int(settings['video_bitrate_cap'])
+    if settings.get('video_target_height'):
+        video_target_height = int(settings['video_target_height'])
+    if settings.get('video_byte_budget'):
+        video_byte_budget = int(settings['video_byte_budget']) * 1024 * 1024
+
     f.close()
 
 backup_stamp = start_time_stamp
@@ -198,20 +240,59 @@ def print_info(_user_info):
     )
 
 
-def get_download_url(_user_info):
-    def get_heighest_video_quality(variants) -> str:  # 找到最高质量的视频地址,并返回
+def get_variant_height(url) -> int:  # 从视频地址中解析分辨率(短边)，如 /vid/avc1/1280x720/
+    match = re.search(r'/(\d+)x(\d+)/', url)
+    if not match:
+        return 0
+    return min(int(match.group(1)), int(match.group(2)))
+
 
-        if len(variants) == 1:  # gif适配
-            return variants[0]['url']
+def select_video_variant(variants):  # 按 video_policy 选择视频地址, 返回 (url, bitrate)
+    if len(variants) == 1:  # gif适配
+        return variants[0]['url'], int(variants[0].get('bitrate', 0))
+
+    mp4_lst = sorted([(int(i['bitrate']), i['url']) for i in variants if 'bitrate' in i])
+    if not mp4_lst:
+        return None, 0
+
+    if video_policy == 'min_bitrate':
+        bitrate, url = mp4_lst[0]
+    elif video_policy == 'bitrate_cap' and video_bitrate_cap:
+        capped = [i for i in mp4_lst if i[0] <= video_bitrate_cap]
+        bitrate, url = capped[-1] if capped else mp4_lst[0]
+    elif video_policy == 'resolution' and video_target_height:
+        fit = [i for i in mp4_lst if get_variant_height(i[1]) <= video_target_height]
+        if fit:
+            bitrate, url = max(fit, key=lambda i: (get_variant_height(i[1]), i[0]))
+        else:
+            bitrate, url = mp4_lst[0]
+    else:  # max_bitrate
+        bitrate, url = mp4_lst[-1]
+    return url, bitrate
 
-        max_bitrate = 0
-        heighest_url = None
-        for i in variants:
-            if 'bitrate' in i:
-                if int(i['bitrate']) > max_bitrate:
-                    max_bitrate = int(i['bitrate'])
-                    heighest_url = i['url']
-        return heighest_url
+
+def estimate_video_bytes(video_info, bitrate) -> int:  # 时长 x 码率 估算视频大小
+    return int(video_info.get('duration_millis', 0) / 1000 * bitrate / 8)
+
+
+def get_download_url(_user_info):
+    def get_media_items(media_lst, tweet_msecs, timestr, name, screen_name, full_text, frr, suffix=''):
+        _items = []
+        for _media in media_lst:
+            if 'video_info' in _media and has_video:
+                video_url, bitrate = select_video_variant(_media['video_info']['variants'])
+                if not video_url:
+                    continue
+                if video_byte_budget:  # 下载量在实际开始传输时才计入上限
+                    video_size_estimates[video_url] = estimate_video_bytes(_media['video_info'], bitrate)
+                _items.append((video_url, f'{timestr}-vid{suffix}',
+                               [tweet_msecs, name, screen_name, _media['expanded_url'], 'Video', video_url, '',
+                                full_text] + frr))
+            else:
+                _items.append((_media['media_url_https'], f'{timestr}-img{suffix}',
+                               [tweet_msecs, name, screen_name, _media['expanded_url'], 'Image',
+                                _media['media_url_https'], '', full_text] + frr))
+        return _items
 
     def get_url_from_content(content):
         global start_label
@@ -253,15 +334,8 @@ def get_download_url(_user_info):
                                 name = a2['name']
                                 screen_name = a2['screen_name']
                             if 'extended_entities' in a:
-                                _photo_lst += [(get_heighest_video_quality(_media['video_info']['variants']),
-                                                f'{timestr}-vid',
-                                                [tweet_msecs, name, f'@{screen_name}', _media['expanded_url'], 'Video',
-                                                 get_heighest_video_quality(_media['video_info']['variants']), '',
-                                                 a['full_text']] + frr) if 'video_info' in _media and has_video else (
-                                    _media['media_url_https'], f'{timestr}-img',
-                                    [tweet_msecs, name, f'@{screen_name}', _media['expanded_url'], 'Image',
-                                     _media['media_url_https'], '', a['full_text']] + frr) for _media in
-                                               a['extended_entities']['media']]
+                                _photo_lst += get_media_items(a['extended_entities']['media'], tweet_msecs, timestr,
+                                                              name, f'@{screen_name}', a['full_text'], frr)
 
                         elif has_retweet:
                             name = a['retweeted_status_result']['result']['core']['user_results']['result']['legacy'][
@@ -274,16 +348,9 @@ def get_download_url(_user_info):
 
                             if 'extended_entities' in a['retweeted_status_result']['result'][
                                 'legacy'] and screen_name != _user_info.screen_name:
-                                _photo_lst += [(get_heighest_video_quality(_media['video_info']['variants']),
-                                                f'{timestr}-vid-retweet',
-                                                [tweet_msecs, name, f"@{screen_name}", _media['expanded_url'], 'Video',
-                                                 get_heighest_video_quality(_media['video_info']['variants']), '',
-                                                 full_text] + frr) if 'video_info' in _media and has_video else (
-                                    _media['media_url_https'], f'{timestr}-img-retweet',
-                                    [tweet_msecs, name, f"@{screen_name}", _media['expanded_url'], 'Image',
-                                     _media['media_url_https'], '', full_text] + frr) for _media in
-                                               a['retweeted_status_result']['result']['legacy']['extended_entities'][
-                                                   'media']]
+                                _photo_lst += get_media_items(
+                                    a['retweeted_status_result']['result']['legacy']['extended_entities']['media'],
+                                    tweet_msecs, timestr, name, f"@{screen_name}", full_text, frr, '-retweet')
 
                     elif not _result[1]:  # 已超出目标时间范围
                         start_label = False
@@ -307,16 +374,9 @@ def get_download_url(_user_info):
                     _result = time_comparison(tweet_msecs, start_time_stamp, end_time_stamp)
                     if _result[0]:  # 符合时间限制
                         if 'extended_entities' in a:
-                            _photo_lst += [(get_heighest_video_quality(_media['video_info']['variants']),
-                                            f'{timestr}-vid',
-                                            [tweet_msecs, _user_info.name, f'@{_user_info.screen_name}',
-                                             _media['expanded_url'], 'Video',
-                                             get_heighest_video_quality(_media['video_info']['variants']), '',
-                                             a['full_text']] + frr) if 'video_info' in _media and has_video else (
-                                _media['media_url_https'], f'{timestr}-img',
-                                [tweet_msecs, _user_info.name, f'@{_user_info.screen_name}', _media['expanded_url'],
-                                 'Image', _media['media_url_https'], '', a['full_text']] + frr) for _media in
-                                           a['extended_entities']['media']]
+                            _photo_lst += get_media_items(a['extended_entities']['media'], tweet_msecs, timestr,
+                                                          _user_info.name, f'@{_user_info.screen_name}',
+                                                          a['full_text'], frr)
                     elif not _result[1]:  # 已超出目标时间范围
                         start_label = False
                         break
@@ -404,49 +464,108 @@ def get_download_url(_user_info):
     return photo_lst
 
 
-def download_control(_user_info):
+def get_media_path(url, prefix, csv_info, index, save_path):  # 返回 (实际请求的url, 保存的文件名)
+    if '.mp4' in url:
+        return url, f'{save_path + os.sep + "video" + os.sep}{prefix}_{index}.mp4'
+    if orig_format:
+        url += f'?name=orig'
+        _file_name = f'{save_path + os.sep + "images" + os.sep}{prefix}_{index}.{csv_info[5][-3:]}'  # 根据图片 url 获取原始格式
+    else:  # 指定格式时，先使用 name=orig，404 则切回 name=4096x4096，以保证最大尺寸
+        _file_name = f'{save_path + os.sep + "images" + os.sep}{prefix}_{index}.{img_format}'
+        if img_format != 'png':
+            url += f'?format=jpg&name=4096x4096'
+        else:
+            url += f'?format=png&name=4096x4096'
+    return url, _file_name
+
+
+def save_metadata(url, prefix, csv_info, index, save_path):  # 仅元数据模式：不访问CDN，只输出CSV/Markdown
+    _, _file_name = get_media_path(url, prefix, csv_info, index, save_path)
+    csv_info[-5] = os.path.split(_file_name)[1]
+    if media_queue:
+        queue_data.add(url, prefix, list(csv_info), index)
+    if md_output:
+        md_file.media_tweet_input(csv_info, prefix)
+    csv_file.data_input(csv_info)
+
+
+def reserve_video_bytes(media_url, response) -> bool:  # 开始传输视频前计入下载量，超出本次运行的上限时返回 False
+    global video_bytes_started
+    if not video_byte_budget or '.mp4' not in media_url or media_url in video_bytes_charged:
+        return True
+    _size = int(response.headers.get('content-length') or video_size_estimates.get(media_url, 0))
+    if video_bytes_started + _size > video_byte_budget:
+        return False
+    video_bytes_started += _size
+    video_bytes_charged.add(media_url)
+    return True
+
+
+def download_control(_user_info, queued=None):
     async def _main():
-        async def down_save(url, prefix, csv_info, order: int):
-            if '.mp4' in url:
-                _file_name = f'{_user_info.save_path + os.sep + "video" + os.sep}{prefix}_{_user_info.count + order}.mp4'
-            else:
-                try:
-                    if orig_format:
-                        url += f'?name=orig'
-                        _file_name = f'{_user_info.save_path + os.sep + "images" + os.sep}{prefix}_{_user_info.count + order}.{csv_info[5][-3:]}'  # 根据图片 url 获取原始格式
-                    else:  # 指定格式时，先使用 name=orig，404 则切回 name=4096x4096，以保证最大尺寸
-                        _file_name = f'{_user_info.save_path + os.sep + "images" + os.sep}{prefix}_{_user_info.count + order}.{img_format}'
-                        if img_format != 'png':
-                            url += f'?format=jpg&name=4096x4096'
-                        else:
-                            url += f'?format=png&name=4096x4096'
-                except Exception as e:
-                    print(url)
-                    logger.error(f'异常：{e},{url}')
-                    return False
+        async def down_save(url, prefix, csv_info, index: int):
+            media_url = url
+            lane = video_lane if '.mp4' in url else image_lane
+            try:
+                url, _file_name = get_media_path(url, prefix, csv_info, index, _user_info.save_path)
+            except Exception as e:
+                print(url)
+                logger.error(f'异常：{e},{url}')
+                return False
+            entry = manifest_data.get_complete(media_url) if manifest_data else None
+            if entry:  # 此前已完整下载，沿用原文件
+                _file_name = manifest_data.file_path(entry)
             os.makedirs(os.path.split(_file_name)[0], exist_ok=True)
             csv_info[-5] = os.path.split(_file_name)[1]
-            if md_output:  # 在下载完毕之前先输出到 Markdown，以尽可能保证高并发下载也能得到正确的推文顺序。
+            if md_output and queued is None:  # 在下载完毕之前先输出到 Markdown，以尽可能保证高并发下载也能得到正确的推文顺序。(排队媒体已在元数据阶段输出)
                 md_file.media_tweet_input(csv_info, prefix)
+            if entry and not manifest_data.conditional_headers(entry):  # 无 ETag/Last-Modified 时，媒体地址不变即视为未变化
+                csv_file.data_input(csv_info)
+                return True
             count = 0
             while True:
                 try:
-                    async with semaphore:
-                        async with httpx.AsyncClient(proxy=proxies) as client:
-                            global down_count
-                            response = await client.get(quote_url(url),
-                                                        timeout=(3.05, 16))  # 如果出现第五次或以上的下载失败,且确认不是网络问题,可以适当降低最大并发数量
+                    async with lane.semaphore:
+                        global down_count
+                        not_modified = False
+                        over_budget = False
+                        async with client.stream('GET', quote_url(url),
+                                                 headers=manifest_data.conditional_headers(entry) if entry else None,
+                                                 timeout=(3.05, 16)) as response:  # 如果出现第五次或以上的下载失败,且确认不是网络问题,可以适当降低最大并发数量
                             if response.status_code == 404:
                                 raise Exception('404')
+                            if response.status_code == 304:  # 文件未变化
+                                not_modified = True
+                            elif response.status_code >= 400:
+                                raise Exception(str(response.status_code))
+                            elif not reserve_video_bytes(media_url, response):  # 超出下载量上限，只保留元数据
+                                over_budget = True
+                            else:
+                                sha256 = hashlib.sha256()
+                                size = 0
+                                with open(_file_name + '.part', 'wb') as f:  # 边下载边写入，避免大视频整体驻留内存
+                                    async for chunk in response.aiter_bytes(65536):
+                                        f.write(chunk)
+                                        sha256.update(chunk)
+                                        size += len(chunk)
+                                        await lane.consume(len(chunk))
+                        if over_budget:
+                            csv_file.data_input(csv_info)
+                            print(f'{_file_name}=====>视频下载量已达上限，跳过下载')
+                            logger.info(f'{_file_name}=====>视频下载量已达上限，跳过下载')
+                            return False
+                        if not not_modified:
+                            os.replace(_file_name + '.part', _file_name)
                             down_count += 1
-                    with open(_file_name, 'wb') as f:
-                        f.write(response.content)
+                            if manifest_data:
+                                manifest_data.record(media_url, url, _file_name, size, response.headers.get('etag'),
+                                                     response.headers.get('last-modified'), sha256.hexdigest())
 
                     csv_file.data_input(csv_info)
 
                     if log_output:
-                        print(f'{_file_name}=====>下载完成')
-                        logger.info(f'{_file_name}=====>下载完成')
+                        print(f'{_file_name}=====>{"未变化，已跳过" if not_modified else "下载完成"}')
+                        logger.info(f'{_file_name}=====>{"未变化，已跳过" if not_modified else "下载完成"}')
 
                     break
                 except Exception as e:
@@ -457,7 +576,7 @@ def download_control(_user_info):
                             logger.error(f'{_file_name}=====>第{count}次下载失败，已跳过该文件。')
                             print(url)
                             logger.error(url)
-                            break
+                            return False
                         print(f'{_file_name}=====>第{count}次下载失败,main正在重试')
                         logger.error(f'{_file_name}=====>第{count}次下载失败,main正在重试')
                         logger.error(e)
@@ -465,23 +584,78 @@ def download_control(_user_info):
                         logger.error(f'{url}')
                     else:
                         url = url.replace('name=orig', 'name=4096x4096')
+            return True
 
-        while True:
-            photo_lst = get_download_url(_user_info)
-            if not photo_lst:
-                break
-            elif photo_lst[0] == True:
-                continue
-            semaphore = asyncio.Semaphore(max_concurrent_requests)  # 最大并发数量，默认为8，对自己网络有自信的可以调高
-            if down_log:
-                await asyncio.gather(*[asyncio.create_task(down_save(url[0], url[1], url[2], order)) for order, url in
-                                       enumerate(photo_lst) if cache_data.is_present(url[0])])
-            else:
-                await asyncio.gather(*[asyncio.create_task(down_save(url[0], url[1], url[2], order)) for order, url in
-                                       enumerate(photo_lst)])
-            _user_info.count += len(photo_lst)  # 更新计数
+        async def down_save_logged(url, prefix, csv_info, index: int):
+            # is_present 在下载前已记录该地址；超出下载量上限或下载失败时移除记录，下次运行时重试
+            if not await down_save(url, prefix, csv_info, index):
+                cache_data.discard(url)
 
-    asyncio.run(_main())
+        # 图片通道并发数默认为8，对自己网络有自信的可以调高；视频通道单独限流，不会挤占图片的下载位
+        image_lane = download_lane(image_concurrent_requests, bandwidth_limit * (1 - video_bandwidth_share))
+        video_lane = download_lane(video_concurrent_requests, bandwidth_limit * video_bandwidth_share)
+
+        async with httpx.AsyncClient(proxy=proxies) as client:  # 所有下载共享连接池
+            if queued is not None:  # 批量下载此前排队的媒体，返回未下载成功的条目
+                results = await asyncio.gather(*[asyncio.create_task(down_save(i['url'], i['prefix'], i['csv_info'], i['index']))
+                                                 for i in queued])
+                return [i for i, ok in zip(queued, results) if not ok]
+
+            video_tasks = []  # 视频在后台持续下载，不阻塞后续页面的图片
+            while True:
+                photo_lst = await asyncio.to_thread(get_download_url, _user_info)
+                if not photo_lst:
+                    break
+                elif photo_lst[0] == True:
+                    continue
+                if metadata_only:
+                    for order, url in enumerate(photo_lst):
+                        save_metadata(url[0], url[1], url[2], _user_info.count + order, _user_info.save_path)
+                else:
+                    # 按推文顺序创建任务，保证 Markdown 输出顺序
+                    _down = down_save_logged if down_log else down_save
+                    tasks = [(url[0], asyncio.create_task(_down(url[0], url[1], url[2], _user_info.count + order)))
+                             for order, url in enumerate(photo_lst) if not down_log or cache_data.is_present(url[0])]
+                    video_tasks += [task for url, task in tasks if '.mp4' in url]
+                    await asyncio.gather(*[task for url, task in tasks if '.mp4' not in url])
+                    if manifest_data:
+                        manifest_data.save()
+                _user_info.count += len(photo_lst)  # 更新计数
+
+            await asyncio.gather(*video_tasks)
+
+    return asyncio.run(_main())
+
+
+def export_parquet(csv_path):
+    try:
+        import pandas as pd
+        pd.read_csv(csv_path, encoding='utf-8-sig').to_parquet(os.path.splitext(csv_path)[0] + '.parquet', index=False)
+    except Exception as e:
+        print(f'导出 Parquet 失败: {e}')
+        logger.error(f'导出 Parquet 失败: {e}')
+
+
+def fetch_queue(_user_info: object):  # 下载仅元数据模式下排队的媒体
+    _user_info.save_path = settings['save_path'] + _user_info.screen_name
+    _queue = queue_gen(_user_info.save_path)
+    queued = _queue.load()
+    if not queued:
+        print(f'{_user_info.screen_name} 无待下载媒体')
+        return
+
+    global csv_file, manifest_data
+    csv_file = csv_gen(_user_info.save_path, _user_info.name, _user_info.screen_name, settings['time_range'])
+    if use_manifest:
+        manifest_data = manifest_gen(_user_info.save_path)
+    failed = download_control(_user_info, queued)
+    csv_file.csv_close()
+    if manifest_data:
+        manifest_data.save()
+        manifest_data = None
+    _queue.rewrite(failed)  # 只保留下载失败的媒体，下次运行时重试
+    print(f'{_user_info.screen_name} 排队媒体下载完成, 共{len(queued)}份, 失败{len(failed)}份\n\n')
+    logger.info(f'{_user_info.screen_name} 排队媒体下载完成, 共{len(queued)}份, 失败{len(failed)}份')
 
 
 def main(_user_info: object):
@@ -506,10 +680,18 @@ def main(_user_info: object):
         md_file = md_gen(_user_info.save_path, _user_info.name, _user_info.screen_name, settings['time_range'],
                          has_likes, media_count_limit)
 
-    if down_log:
+    if down_log and not metadata_only:
         global cache_data
         cache_data = cache_gen(_user_info.save_path)
 
+    if metadata_only and media_queue:
+        global queue_data
+        queue_data = queue_gen(_user_info.save_path)
+
+    global manifest_data
+    if use_manifest and not metadata_only:
+        manifest_data = manifest_gen(_user_info.save_path)
+
     if autoSync:
         files = sorted(os.listdir(_user_info.save_path))
         if len(files) > 0:
@@ -530,11 +712,17 @@ def main(_user_info: object):
     download_control(_user_info)
 
     csv_file.csv_close()
+    if parquet_output:
+        export_parquet(csv_file.path)
 
     if md_output:
         md_file.md_close()
 
-    if down_log:
+    if manifest_data:
+        manifest_data.save()
+        manifest_data = None
+
+    if down_log and not metadata_only:
         del cache_data
     print(f'{_user_info.name}下载完成\n\n')
     logger.info(f'{_user_info.name}下载完成')
@@ -543,9 +731,13 @@ def main(_user_info: object):
 if __name__ == '__main__':
     _start = time.time()
     logger.info("程序启动")
-    for i in settings['user_lst'].split(','):
-        main(User_info(i))
-        start_label = True
-        First_Page = True
+    if '--fetch-queue' in sys.argv:  # python main.py --fetch-queue 批量下载仅元数据模式下排队的媒体
+        for i in settings['user_lst'].split(','):
+            fetch_queue(User_info(i))
+    else:
+        for i in settings['user_lst'].split(','):
+            main(User_info(i))
+            start_label = True
+            First_Page = True
     logger.info(f'共耗时:{time.time() - _start}秒\n共调用{request_count}次API\n共下载{down_count}份图片/视频')
     print(f'共耗时:{time.time() - _start}秒\n共调用{request_count}次API\n共下载{down_count}份图片/视频')
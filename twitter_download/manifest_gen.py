@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import hashlib
+
+class manifest_gen():
+    # 记录每个已下载媒体的 url / 大小 / ETag / Last-Modified / sha256, 用于重复运行时跳过或条件请求
+
+    def __init__(self, save_path) -> None:
+        self.save_path = save_path
+        self.manifest_path = save_path + os.sep + "manifest.json"
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        else:
+            self.entries = {}
+
+    def save(self):
+        with open(self.manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+
+    def file_path(self, entry):
+        return self.save_path + os.sep + entry['file']
+
+    def get_complete(self, url):
+        # 返回已完整下载的记录(文件存在且大小一致), 否则返回 None
+        entry = self.entries.get(url)
+        if not entry:
+            return None
+        _path = self.file_path(entry)
+        if not os.path.exists(_path) or os.path.getsize(_path) != entry['size']:
+            return None
+        return entry
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def record(self, url, request_url, file_name, size, etag, last_modified, sha256):
+        self.entries[url] = {
+            'request_url': request_url,
+            'file': os.path.relpath(file_name, self.save_path),
+            'size': size,
+            'etag': etag,
+            'last_modified': last_modified,
+            'sha256': sha256,
+        }
+
+    def verify(self, checksum=False) -> list:
+        # 检查所有记录, 返回损坏或缺失文件的 url 列表; checksum 为 True 时额外校验 sha256
+        broken = []
+        for url, entry in self.entries.items():
+            _path = self.file_path(entry)
+            if not os.path.exists(_path) or os.path.getsize(_path) != entry['size']:
+                broken.append(url)
+            elif checksum and file_sha256(_path) != entry['sha256']:
+                broken.append(url)
+        return broken
+
+
+def file_sha256(path):
+    m = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            m.update(chunk)
+    return m.hexdigest()
+
+
+def load_proxy():
+    # 与 main.py 使用相同的 settings.json 代理设置
+    try:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'settings.json'), 'r', encoding='utf8') as f:
+            return json.load(f).get('proxy') or None
+    except Exception:
+        return None
+
+
+def repair(manifest, urls):
+    # 重新下载损坏的文件并更新记录, 边下载边写入 .part 文件并计算 sha256, 与 main.py 的 down_save 一致
+    import httpx
+    with httpx.Client(follow_redirects=True, timeout=(3.05, 16), proxy=load_proxy()) as client:
+        for url in urls:
+            entry = manifest.entries[url]
+            _path = manifest.file_path(entry)
+            try:
+                with client.stream('GET', entry['request_url']) as response:
+                    response.raise_for_status()
+                    sha256 = hashlib.sha256()
+                    size = 0
+                    with open(_path + '.part', 'wb') as f:
+                        for chunk in response.iter_bytes(65536):
+                            f.write(chunk)
+                            sha256.update(chunk)
+                            size += len(chunk)
+            except Exception as e:
+                print(f'{_path}=====>修复失败: {e}')
+                continue
+            os.replace(_path + '.part', _path)
+            manifest.record(url, entry['request_url'], _path, size, response.headers.get('etag'),
+                            response.headers.get('last-modified'), sha256.hexdigest())
+            print(f'{_path}=====>已修复')
+    manifest.save()
+
+
+if __name__ == '__main__':
+    # python manifest_gen.py <用户文件夹> [--checksum] [--repair]
+    if len(sys.argv) < 2:
+        print('用法: python manifest_gen.py <用户文件夹> [--checksum] [--repair]')
+        sys.exit(1)
+    _manifest = manifest_gen(sys.argv[1].rstrip(os.sep))
+    broken_lst = _manifest.verify(checksum='--checksum' in sys.argv)
+    print(f'共{len(_manifest.entries)}条记录, 损坏或缺失{len(broken_lst)}个')
+    for i in broken_lst:
+        print(_manifest.file_path(_manifest.entries[i]))
+    if broken_lst and '--repair' in sys.argv:
+        repair(_manifest, broken_lst)
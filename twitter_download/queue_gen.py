@@ -0,0 +1,32 @@
+import os
+import json
+
+class queue_gen():
+    # 仅元数据模式下记录待下载的媒体, 供之后批量下载
+
+    def __init__(self, save_path) -> None:
+        self.queue_path = save_path + os.sep + "media_queue.jsonl"
+
+    def add(self, url, prefix, csv_info, index):
+        with open(self.queue_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'url': url, 'prefix': prefix, 'csv_info': csv_info, 'index': index}, ensure_ascii=False) + '\n')
+
+    def load(self) -> list:
+        if not os.path.exists(self.queue_path):
+            return []
+        with open(self.queue_path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def rewrite(self, items):
+        # 用 items 替换队列内容, 为空时删除队列文件
+        if not items:
+            self.clear()
+            return
+        with open(self.queue_path + '.tmp', 'w', encoding='utf-8') as f:
+            for i in items:
+                f.write(json.dumps(i, ensure_ascii=False) + '\n')
+        os.replace(self.queue_path + '.tmp', self.queue_path)
+
+    def clear(self):
+        if os.path.exists(self.queue_path):
+            os.remove(self.queue_path)
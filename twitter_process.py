@@ -5,9 +5,17 @@ import re
 import chardet
 import pandas as pd
 import os
+import sys
 # 导入 agent 和 logger
-from agent.main import social_assessor_assistant, extract_time_from_filename
+from agent.main import extract_time_from_filename
+from agent.batch import analyze_posts
+from agent.nodes import SupervisorNode
 from agent.log_config import get_logger
+from agent.utils.cache import cache_stats
+from agent.utils.call_llm import stream_stats
+from agent.utils.progress import ProgressLedger
+from agent.utils.structured import parse_stats
+from agent.utils.trace import trace_summary
 
 def build_input_content(text_content: str, video_content: str = None) -> str:
     cleaned_text = re.sub(r'https?://\S+', '', text_content)
@@ -33,7 +41,9 @@ def read_csv_with_encoding(file_path, usecols=None):
         except Exception as e:
             print(f"❌ 尝试编码 {enc} 失败: {e}")
     return None
-def twitter_process():
+def twitter_process(mode=None):
+    # 分析模式：full 或 fast，默认读取环境变量 ANALYSIS_MODE；快速模式的结果写入单独的文件
+    mode = mode or os.getenv("ANALYSIS_MODE", "full")
     task_date = datetime.datetime.now().strftime("%Y年%m月%d日%H时%M分")
     task_log_file_path = os.path.join(f"task_{task_date}.log")
     logger = get_logger(__name__, f"{task_log_file_path}")
@@ -41,9 +51,14 @@ def twitter_process():
 
     # 设置路径
     base_path = os.path.dirname(os.path.abspath(__file__))  # 自动获取当前项目根目录
-    social_data_path = os.path.join(base_path, "social_data", "twitter", "relDonaldTrump", "social_data.csv")
-    video_sct_path = os.path.join(base_path, "social_data", "twitter", "relDonaldTrump", "video_sct.csv")
-    output_path = os.path.join(base_path, "social_data", "twitter", "relDonaldTrump", "twitter_social_data_enhanced.csv")
+    # 数据目录可通过环境变量 TWITTER_DATA_DIR 指定，如 fake_services.py 生成的测试数据
+    data_dir = os.getenv("TWITTER_DATA_DIR") or os.path.join(base_path, "social_data", "twitter", "relDonaldTrump")
+    social_data_path = os.path.join(data_dir, "social_data.csv")
+    video_sct_path = os.path.join(data_dir, "video_sct.csv")
+    output_name = "twitter_social_data_enhanced.csv" if mode == "full" else f"twitter_social_data_enhanced_{mode}.csv"
+    output_path = os.path.join(data_dir, output_name)
+    # 已写入结果的帖子记录在进度文件中，重新运行时跳过
+    ledger = ProgressLedger(os.path.splitext(output_path)[0] + "_progress.jsonl")
 
     import chardet
 
@@ -115,10 +130,17 @@ def twitter_process():
     # 应用清洗逻辑到 '推文内容' 列
     merged_df['社媒文本内容'] = merged_df['社媒文本内容'].apply(clean_tweet)
 
-    # 循环处理每一行
+    # 构建每一行的分析任务
+    tasks = []
+    skipped = 0
     for index, row in merged_df.iterrows():
         user_name = row["社媒人名称"]
         saved_file = row["多媒体文件名称"]
+        # 同一条推文可能对应多个媒体文件，以来源链接 + 媒体文件名作为唯一标识
+        key = f"{row['来源链接']}#{saved_file}"
+        if ledger.is_done(key):
+            skipped += 1
+            continue
         tweet_content = row["社媒文本内容"]
         video_content = row["视频字幕或文字图片对应-文本内容"]
 
@@ -128,11 +150,15 @@ def twitter_process():
 
         input_content = build_input_content(tweet_content, video_content)
 
-        logger.info(f"正在分析用户 [{user_name}] 的帖子，时间：{create_time}")
-
-        # 调用 agent 函数
+        tasks.append({"index": index, "key": key, "user_name": user_name, "create_time": create_time,
+                      "input_content": input_content})
+    if skipped:
+        logger.info(f"根据进度记录跳过已完成的 {skipped} 行，剩余 {len(tasks)} 行待分析。")
 
-        result,context = social_assessor_assistant(user_name, create_time, input_content, logger)
+    # 并发调用 agent 函数，结果按行顺序返回
+    for task, (result, context) in analyze_posts(tasks, logger, mode=mode):
+        index = task["index"]
+        user_name = task["user_name"]
 
         try:
             # 假设返回的是 JSON 格式字符串或字典
@@ -141,6 +167,11 @@ def twitter_process():
             else:
                 result_dict = result
 
+            # 未通过完整性检查的结果不写入也不记录进度，下次运行时重新分析
+            if not SupervisorNode.is_complete(result_dict):
+                logger.warning(f"[分析未完成] 用户 [{user_name}] 第 {index} 行结果不完整，留待下次运行: {result_dict}")
+                continue
+
             # 写入 DataFrame
             merged_df.at[index, '主题'] = ", ".join(result_dict.get('topics', []))
             merged_df.at[index, '情感倾向'] = result_dict.get('sentiment', '')
@@ -151,7 +182,7 @@ def twitter_process():
             logger.info(f"[处理完成] 用户 [{user_name}], 结果已写入。")
             # 以追加模式写入当前行
             # 构造当前行的 DataFrame
-            current_row_df = merged_df.iloc[[index]]
+            current_row_df = merged_df.loc[[index]]
             write_header = False  # 后续不再写入表头
 
             current_row_df.to_csv(
@@ -162,6 +193,7 @@ def twitter_process():
                 encoding="utf-8-sig"
             )
 
+            ledger.mark_done(task["key"], index=int(index))
             logger.info(f"当前进度已保存至 {output_path}")
 
         except Exception as e:
@@ -170,7 +202,12 @@ def twitter_process():
 
     # 保存更新后的 CSV
     logger.info(f"所有数据处理完成，结果已保存至 {output_path}")
+    logger.info(f"缓存命中统计: {cache_stats()}")
+    logger.info(f"模型流式响应统计: {stream_stats()}")
+    logger.info(f"模型响应解析统计: {parse_stats()}")
+    logger.info(f"耗时统计: {trace_summary()}")
 
 
 if __name__ == "__main__":
-    twitter_process()
+    # python twitter_process.py [--fast]
+    twitter_process("fast" if "--fast" in sys.argv else None)
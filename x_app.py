@@ -26,9 +26,13 @@ def save_settings(
         has_retweet, high_lights, likes,
         time_range, autoSync, down_log,
         image_format, has_video, log_output,
-        max_concurrent_requests, proxy, md_output, media_count_limit
+        max_concurrent_requests, proxy, md_output, media_count_limit,
+        metadata_only, media_queue,
+        video_policy, video_bitrate_cap, video_target_height, video_byte_budget
 ):
-    settings = {
+    # 保留界面上未提供的配置项
+    settings = load_settings() if os.path.exists(SETTINGS_PATH) else {}
+    settings.update({
         "save_path": save_path,
         "user_lst": user_lst,
         "cookie": cookie,
@@ -44,8 +48,14 @@ def save_settings(
         "max_concurrent_requests": int(max_concurrent_requests),
         "proxy": proxy,
         "md_output": md_output,
-        "media_count_limit": int(media_count_limit)
-    }
+        "media_count_limit": int(media_count_limit),
+        "metadata_only": metadata_only,
+        "media_queue": media_queue,
+        "video_policy": video_policy,
+        "video_bitrate_cap": int(video_bitrate_cap),
+        "video_target_height": int(video_target_height),
+        "video_byte_budget": int(video_byte_budget)
+    })
 
     with open(SETTINGS_PATH, 'w', encoding='utf-8') as f:
         json.dump(settings, f, indent=4)
@@ -159,6 +169,23 @@ with gr.Blocks(title="🐦 Twitter 数据抓取配置与执行") as demo:
         media_count_limit = gr.Number(label="Markdown 单文件媒体数限制",
                                       value=lambda: load_settings()['media_count_limit'])
 
+        with gr.Row():
+            metadata_only = gr.Checkbox(label="仅抓取元数据 (不下载图片/视频)",
+                                        value=lambda: load_settings().get('metadata_only', False))
+            media_queue = gr.Checkbox(label="记录待下载媒体 (之后可批量下载)",
+                                      value=lambda: load_settings().get('media_queue', False))
+
+        with gr.Row():
+            video_policy = gr.Dropdown(choices=["max_bitrate", "min_bitrate", "bitrate_cap", "resolution"],
+                                       label="视频清晰度策略",
+                                       value=lambda: load_settings().get('video_policy', 'max_bitrate'))
+            video_bitrate_cap = gr.Number(label="最大码率 (bps, bitrate_cap 策略)",
+                                          value=lambda: load_settings().get('video_bitrate_cap', 0))
+            video_target_height = gr.Number(label="目标分辨率 (短边像素, resolution 策略)",
+                                            value=lambda: load_settings().get('video_target_height', 0))
+            video_byte_budget = gr.Number(label="单次视频下载量上限 (MB, 0为不限制)",
+                                          value=lambda: load_settings().get('video_byte_budget', 0))
+
         save_button = gr.Button("💾 保存设置")
         output = gr.Textbox(label="操作结果")
 
@@ -180,7 +207,13 @@ with gr.Blocks(title="🐦 Twitter 数据抓取配置与执行") as demo:
                 max_concurrent_requests,
                 proxy,
                 md_output,
-                media_count_limit
+                media_count_limit,
+                metadata_only,
+                media_queue,
+                video_policy,
+                video_bitrate_cap,
+                video_target_height,
+                video_byte_budget
             ],
             outputs=output
         )